@@ -0,0 +1,91 @@
+"""
+Regression gate for the micro-benchmarks. Compares the relative
+timings against benchmarks/baseline.json and exits with status 1
+when a benchmark is slower than its baseline beyond the tolerance.
+
+    python -m benchmarks.compare --tolerance 0.25
+    python -m benchmarks.compare --update
+"""
+import argparse
+import json
+import os
+import sys
+from .micro import run
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def best_results(rounds):
+    """
+    Runs the micro-benchmarks rounds times and keeps the best of
+    every benchmark, along with its noise: the spread between the
+    best and the worst round, relative to the best.
+    """
+    runs = [run() for i in range(rounds)]
+    results = {}
+    for name in runs[0]:
+        values = sorted(runs, key=lambda result: result[name]['relative'])
+        best = dict(values[0][name])
+        best['noise'] = values[-1][name]['relative'] / best['relative'] - 1
+        results[name] = best
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns (name, baseline, current, ratio, failed) tuples. A
+    benchmark fails when it is slower than its baseline by more than
+    the tolerance plus the noise measured between the rounds, the noise
+    counting for at most the tolerance again.
+    """
+    rows = []
+    for name in sorted(results):
+        current = results[name]['relative']
+        expected = baseline.get(name, {}).get('relative')
+        if expected is None:
+            rows.append((name, None, current, None, False))
+            continue
+        ratio = current / expected
+        noise = results[name].get('noise', 0)
+        allowed = tolerance + min(noise, tolerance)
+        rows.append((name, expected, current, ratio, ratio > 1 + allowed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown, 0.25 is 25%%')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--update', action='store_true',
+                        help='store the current timings as the baseline')
+    args = parser.parse_args(argv)
+
+    results = best_results(args.rounds)
+    if args.update:
+        for result in results.values():
+            del result['noise']
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('Baseline written to {}'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    failed = False
+    for name, expected, current, ratio, regressed in compare(
+            results, baseline, args.tolerance):
+        if expected is None:
+            print('{:<28} new benchmark, no baseline'.format(name))
+            continue
+        failed = failed or regressed
+        print('{:<28} {:>9.4f} -> {:>9.4f} ({:+.1f}%){}'.format(
+            name, expected, current, (ratio - 1) * 100,
+            '  REGRESSION' if regressed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
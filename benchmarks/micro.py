@@ -0,0 +1,121 @@
+"""
+Micro-benchmarks of the pure python post processing of the views.
+
+    python -m benchmarks.micro
+
+Timings are reported in microseconds and relative to a calibration
+loop, so results of different machines can be compared.
+"""
+import copy
+import gc
+import sys
+import timeit
+from .stub_server import Corpus
+
+CALIBRATION_LOOPS = 100000
+# Shortest sample, in seconds. Samples of a few microseconds are
+# dominated by timer and scheduler noise.
+MIN_SAMPLE_TIME = 0.005
+
+
+def calibration():
+    total = 0
+    for i in range(CALIBRATION_LOOPS):
+        total += i % 7
+    return total
+
+
+def benchmarks(corpus):
+    """
+    Returns (name, setup, function) tuples. setup builds fresh
+    inputs, since the processing mutates the posts.
+    """
+    from wordpress_api.feed_views import trim_excerpt
+    from wordpress_api.views import (
+        match_terms, normalize_post, normalize_related_posts)
+    page = corpus.posts[:10]
+    post = corpus.posts[0]
+    tags = corpus.tags
+    categories = corpus.categories
+    excerpts = [{'rendered': p['excerpt']['rendered'][:-4] +
+                 ' <a href="#">Continue reading</a></p>'} for p in page]
+
+    def list_page(posts):
+        for blog in posts:
+            normalize_post(blog)
+
+    def detail_taxonomies(blog):
+        match_terms(categories, blog['categories'])
+        match_terms(tags, blog['tags'])
+
+    def feed_excerpts(items):
+        for excerpt in items:
+            trim_excerpt(excerpt)
+
+    return [
+        ('list_page_posts', lambda: copy.deepcopy(page), list_page),
+        ('detail_taxonomy_matching', lambda: post, detail_taxonomies),
+        ('detail_related_posts', lambda: copy.deepcopy(page[:4]),
+         normalize_related_posts),
+        ('feed_excerpt_trimming', lambda: copy.deepcopy(excerpts),
+         feed_excerpts),
+    ]
+
+
+def measure(setup, function, number, repeat):
+    """
+    Returns the best time of a call over repeat samples of at least
+    number calls, more if needed to last MIN_SAMPLE_TIME, and the
+    median ratio of the samples to a calibration loop run just
+    before each of them, so both see the same machine load.
+    """
+    value = setup()
+    start = timeit.default_timer()
+    function(value)
+    single = max(timeit.default_timer() - start, 1e-7)
+    number = max(number, int(MIN_SAMPLE_TIME / single) + 1)
+    samples = []
+    ratios = []
+    for i in range(repeat):
+        inputs = [setup() for j in range(number)]
+        calibrated = timeit.timeit(calibration, number=1)
+        gc.disable()
+        try:
+            start = timeit.default_timer()
+            for value in inputs:
+                function(value)
+            elapsed = (timeit.default_timer() - start) / number
+        finally:
+            gc.enable()
+        samples.append(elapsed)
+        ratios.append(elapsed / calibrated)
+    ratios.sort()
+    return min(samples), ratios[len(ratios) // 2]
+
+
+def run(number=500, repeat=9, tags=2000):
+    from .run import configure
+    from django.conf import settings
+    if not settings.configured:
+        configure('http://127.0.0.1/', 0)
+    corpus = Corpus(posts=20, tags=tags)
+    results = {}
+    for name, setup, function in benchmarks(corpus):
+        elapsed, relative = measure(setup, function, number, repeat)
+        results[name] = {
+            'us': elapsed * 1e6,
+            'relative': relative,
+        }
+    return results
+
+
+def main():
+    results = run()
+    for name, result in sorted(results.items()):
+        print('{:<28} {:>10.1f} us {:>10.4f} x calibration'.format(
+            name, result['us'], result['relative']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
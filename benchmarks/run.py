@@ -0,0 +1,212 @@
+"""
+Drives the blog views against a local stub of WordPress and reports
+requests/sec, p50/p99 latency and upstream calls per page.
+
+    python -m benchmarks.run --posts 2000 --tags 5000 --latency 0.02
+
+With --replay, the responses of a cassette recorded with
+WP_API_RECORD_CASSETTE are served instead of the synthetic corpus:
+
+    python -m benchmarks.run --replay blog.jsonl.gz --path / --path /my-post/
+
+With --faults, the WP_API_FAULT_INJECTION rules of a JSON file degrade
+the stub responses, to measure the views under upstream failures:
+
+    python -m benchmarks.run --faults faults.json
+"""
+import argparse
+import json
+import sys
+import time
+from django.conf import settings
+from .stub_server import Corpus, StubWordPressServer
+
+
+def configure(wp_url, cache_timeout, extra_settings=None):
+    options = dict(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        ALLOWED_HOSTS=['*'],
+        ROOT_URLCONF='benchmarks.urls',
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        INSTALLED_APPS=[
+            'django.contrib.contenttypes',
+            'django.contrib.sessions',
+            'django.contrib.messages',
+            'wordpress_api',
+        ],
+        MIDDLEWARE=[
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.contrib.messages.middleware.MessageMiddleware',
+        ],
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'APP_DIRS': True,
+            'OPTIONS': {'context_processors': [
+                'django.template.context_processors.request',
+            ]},
+        }],
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+        MESSAGE_STORAGE='django.contrib.messages.storage.cookie.'
+                        'CookieStorage',
+        WP_URL=wp_url,
+        BLOG_POSTS_PER_PAGE=10,
+        WP_API_BLOG_CACHE_TIMEOUT=cache_timeout,
+    )
+    options.update(extra_settings or {})
+    settings.configure(**options)
+    import django
+    django.setup()
+
+
+def scenarios(corpus):
+    posts = corpus.posts
+    return [
+        ('list', ['/?page={}'.format(page) for page in range(1, 6)]),
+        ('detail', ['/{}/'.format(post['slug']) for post in posts[:50]]),
+        ('category', ['/category/{}/'.format(category['slug'])
+                      for category in corpus.categories[:5]]),
+        ('tag', ['/tag/{}/'.format(tag_id) for tag_id in (
+            'tag-{}'.format(post['tags'][0]) for post in posts[:5]
+            if post['tags'])]),
+        ('author', ['/author/{}/'.format(author['slug'])
+                    for author in corpus.authors[:5]]),
+        ('feed', ['/feed/']),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def run_scenario(client, server, urls, requests):
+    latencies = []
+    statuses = {}
+    calls_before = server.total_calls()
+    start = time.time()
+    for i in range(requests):
+        request_start = time.time()
+        response = client.get(urls[i % len(urls)])
+        latencies.append(time.time() - request_start)
+        statuses[response.status_code] = statuses.get(
+            response.status_code, 0) + 1
+    elapsed = time.time() - start
+    return {
+        'requests': requests,
+        'rps': requests / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'upstream_per_page': float(
+            server.total_calls() - calls_before) / requests,
+        'statuses': statuses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--tags', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--content-words', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every stub response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random extra seconds per stub response')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per scenario')
+    parser.add_argument('--cache-timeout', type=int, default=0,
+                        help='WP_API_BLOG_CACHE_TIMEOUT, 0 disables cache')
+    parser.add_argument('--scenario', action='append',
+                        help='only run the given scenarios')
+    parser.add_argument('--replay', metavar='CASSETTE',
+                        help='replay a recorded cassette, no stub server')
+    parser.add_argument('--path', action='append', default=[],
+                        help='blog path to request when replaying')
+    parser.add_argument('--record', metavar='CASSETTE',
+                        help='record the stub responses to a cassette')
+    parser.add_argument('--faults', metavar='RULES',
+                        help='JSON file with fault injection rules')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        return replay(args)
+
+    corpus = Corpus(
+        posts=args.posts, tags=args.tags, categories=args.categories,
+        authors=args.authors, content_words=args.content_words)
+    server = StubWordPressServer(
+        corpus, latency=args.latency, jitter=args.jitter).start()
+    extra_settings = {}
+    if args.record:
+        extra_settings['WP_API_RECORD_CASSETTE'] = args.record
+    if args.faults:
+        with open(args.faults) as rules_file:
+            extra_settings['WP_API_FAULT_INJECTION'] = json.load(rules_file)
+    configure(server.url, args.cache_timeout, extra_settings)
+    from django.test import Client
+    client = Client()
+
+    header = '{:<10} {:>9} {:>10} {:>10} {:>10} {:>14}  {}'.format(
+        'scenario', 'requests', 'req/s', 'p50 ms', 'p99 ms',
+        'upstream/page', 'statuses')
+    print(header)
+    print('-' * len(header))
+    for name, urls in scenarios(corpus):
+        if args.scenario and name not in args.scenario:
+            continue
+        result = run_scenario(client, server, urls, args.requests)
+        print('{:<10} {:>9} {:>10.1f} {:>10.2f} {:>10.2f} {:>14.2f}  {}'
+              .format(name, result['requests'], result['rps'],
+                      result['p50'], result['p99'],
+                      result['upstream_per_page'], result['statuses']))
+    server.shutdown()
+    return 0
+
+
+class CountingTransport(object):
+    """
+    Counts the requests served by the replay transport, so replayed
+    runs report upstream calls like the stub server does.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        return self.inner.get(*args, **kwargs)
+
+    def total_calls(self):
+        return self.calls
+
+
+def replay(args):
+    from wordpress_api.transports import ReplayTransport
+    transport = ReplayTransport(args.replay)
+    urls = [record['url'] for record in transport.records.values()]
+    if not urls or not args.path:
+        print('The cassette is empty or no --path was given')
+        return 1
+    counter = CountingTransport(transport)
+    configure(urls[0].split('wp-json/')[0], args.cache_timeout)
+    from django.test import Client
+    from wordpress_api import transports
+    transports._transport = counter
+    result = run_scenario(Client(), counter, args.path, args.requests)
+    print('replay: {requests} requests, {rps:.1f} req/s, p50 {p50:.2f} ms, '
+          'p99 {p99:.2f} ms, {upstream_per_page:.2f} upstream/page, '
+          '{statuses}'.format(**result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Local stub of the WordPress REST API serving a synthetic corpus.
+"""
+import json
+import math
+import random
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    'django python wordpress blog api cache latency server client '
+    'request response template view tag category author media post '
+    'search index page feed deploy worker thread process memory disk'
+).split()
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for i in range(words))
+
+
+class Corpus(object):
+    """
+    Synthetic blog with the given number of posts, tags, categories
+    and authors. Posts are shaped like wordpress _embed=true posts.
+    """
+
+    def __init__(self, posts=500, tags=2000, categories=50, authors=20,
+                 content_words=400, seed=42):
+        rng = random.Random(seed)
+        self.authors = [{
+            'id': i, 'name': 'Author {}'.format(i),
+            'slug': 'author-{}'.format(i), 'url': '', 'description': '',
+            'link': 'https://example.com/blog/author/author-{}/'.format(i),
+            'avatar_urls': {'24': 'https://example.com/avatar.png'},
+        } for i in range(1, authors + 1)]
+        self.tags = [{
+            'id': i, 'name': 'Tag {}'.format(i), 'slug': 'tag-{}'.format(i),
+            'count': 0, 'description': '', 'taxonomy': 'post_tag',
+            'link': 'https://example.com/blog/tag/tag-{}/'.format(i),
+        } for i in range(1, tags + 1)]
+        self.categories = [{
+            'id': i, 'name': 'Category {}'.format(i),
+            'slug': 'category-{}'.format(i), 'count': 0, 'description': '',
+            'taxonomy': 'category',
+            'link': 'https://example.com/blog/category/category-{}/'.format(
+                i),
+        } for i in range(1, categories + 1)]
+        self.posts = []
+        for i in range(posts, 0, -1):
+            author = rng.choice(self.authors)
+            date = time.strftime(
+                '%Y-%m-%dT%H:%M:%S', time.gmtime(1262304000 + i * 86400))
+            media_id = 100000 + i
+            self.posts.append({
+                'id': i,
+                'slug': 'post-{}'.format(i),
+                'date': date,
+                'date_gmt': date,
+                'author': author['id'],
+                'title': {'rendered': sentence(rng, 6)},
+                'excerpt': {'rendered': '<p>{}</p>'.format(
+                    sentence(rng, 40))},
+                'content': {'rendered': '<p>{}</p>'.format(
+                    sentence(rng, content_words))},
+                'tags': sorted(set(
+                    rng.randint(1, max(tags, 1)) for j in range(5)))
+                if tags else [],
+                'categories': [rng.randint(1, max(categories, 1))]
+                if categories else [],
+                'featured_media': media_id,
+                '_embedded': {
+                    'author': [author],
+                    'wp:featuredmedia': [{
+                        'id': media_id,
+                        'source_url': 'https://example.com/{}.jpg'.format(
+                            media_id),
+                        'media_details': {'sizes': {
+                            size: {'source_url': 'https://example.com/'
+                                   '{}-{}.jpg'.format(media_id, size)}
+                            for size in ('thumbnail', 'medium', 'large')}},
+                    }],
+                },
+            })
+
+
+def matches(post, query):
+    if 'name' in query and post['slug'] != query['name']:
+        return False
+    for key in ('tags', 'tag'):
+        if key in query:
+            wanted = set(int(tag) for tag in query[key].split(','))
+            if not wanted.intersection(post['tags']):
+                return False
+    if 'categories' in query and\
+       int(query['categories']) not in post['categories']:
+        return False
+    if 'author' in query and int(query['author']) != post['author']:
+        return False
+    if 'search' in query:
+        text = (post['title']['rendered'] + ' ' +
+                post['content']['rendered']).lower()
+        if not all(term in text for term in query['search'].lower().split()):
+            return False
+    return True
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = dict(
+            (key, values[0]) for key, values in parse_qs(url.query).items())
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        with server.lock:
+            server.calls[endpoint] = server.calls.get(endpoint, 0) + 1
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.random() * server.jitter)
+        corpus = server.corpus
+        if endpoint == 'posts':
+            items = [post for post in corpus.posts if matches(post, query)]
+            if query.get('orderby') == 'title':
+                items.sort(key=lambda post: post['title']['rendered'])
+            if query.get('_fields'):
+                fields = query['_fields'].split(',')
+                items = [dict((field, post[field]) for field in fields)
+                         for post in items]
+            elif query.get('_embed') != 'true':
+                items = [dict((key, value) for key, value in post.items()
+                              if key != '_embedded') for post in items]
+        elif endpoint == 'tags':
+            items = corpus.tags
+        elif endpoint == 'categories':
+            items = corpus.categories
+        elif endpoint == 'users':
+            items = corpus.authors
+        else:
+            self.send_error(404)
+            return
+        per_page = int(query.get('per_page', 10))
+        page = int(query.get('page', 1))
+        total_pages = int(math.ceil(float(len(items)) / per_page))
+        if page > max(total_pages, 1):
+            self.send_error(400)
+            return
+        body = json.dumps(
+            items[(page - 1) * per_page:page * per_page]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-WP-Total', str(len(items)))
+        self.send_header('X-WP-TotalPages', str(total_pages))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubWordPressServer(socketserver.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    """
+    Serves the corpus on localhost. Every request waits latency
+    seconds plus a random jitter. Calls are counted per endpoint.
+    """
+    daemon_threads = True
+
+    def __init__(self, corpus, latency=0.0, jitter=0.0, port=0):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', port), StubHandler)
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+from django.conf.urls import include, url
+from wordpress_api.feed_views import LatestEntriesFeed
+
+urlpatterns = [
+    url(r'^feed/$', LatestEntriesFeed(), name='benchmark_feed'),
+    url(r'^', include('wordpress_api.urls')),
+]
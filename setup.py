@@ -40,6 +40,8 @@ setup(
     url='https://github.com/swappsco/django-wordpress-api',
     packages=[
         'wordpress_api',
+        'wordpress_api.management',
+        'wordpress_api.management.commands',
     ],
     include_package_data=True,
     install_requires=[
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class WordpressApiConfig(AppConfig):
+    name = 'wordpress_api'
+    verbose_name = 'Wordpress API'
+
+    def ready(self):
+        if getattr(settings, 'WP_API_PREFETCH_ON_STARTUP', False):
+            from .prefetch import start_prefetch
+            start_prefetch()
+        if getattr(settings, 'WP_API_CACHE_SNAPSHOT', None):
+            from .snapshots import restore_on_startup, start_snapshots
+            restore_on_startup()
+            start_snapshots()
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+from django.conf import settings
+
+
+def slug_filter_enabled():
+    return getattr(settings, 'WP_API_SLUG_FILTER', False)
+
+
+class BloomFilter(object):
+    """
+    Compact probabilistic set. Membership tests may return false
+    positives at the configured error rate but never false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(int(round(
+            float(self.size) / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.md5(item.encode('utf-8')).digest()
+        first, second = struct.unpack('<QQ', digest)
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item))
+
+
+class KnownSlugs(object):
+    """
+    Bloom filter of the post slugs of one language. It is rebuilt
+    from a full slug sweep every refresh seconds. A missing slug
+    triggers at most one probe of the latest posts every
+    probe_interval seconds, so very new posts are still found.
+    """
+
+    def __init__(self, slugs, error_rate=0.01):
+        self.filter = BloomFilter(len(slugs) * 2 + 1000, error_rate)
+        for slug in slugs:
+            self.filter.add(slug)
+        self.built_at = time.time()
+        self.last_probe = 0
+
+    def __contains__(self, slug):
+        return slug in self.filter
+
+    def add(self, slugs):
+        for slug in slugs:
+            self.filter.add(slug)
+
+
+_filters = {}
+_failures = {}
+_filters_lock = threading.Lock()
+
+
+def _build(connector):
+    slugs = connector.get_post_slugs()
+    if 'server_error' in slugs:
+        return None
+    known = KnownSlugs(slugs)
+    _filters[connector.namespace] = known
+    return known
+
+
+def _sweep(connector, failures):
+    try:
+        now = time.time()
+        if _build(connector) is None:
+            _failures[connector.namespace] = (failures + 1, now)
+        else:
+            _failures.pop(connector.namespace, None)
+    finally:
+        _filters_lock.release()
+
+
+def refresh_known_slugs(connector, background=True):
+    """
+    Sweeps the slugs of the connector language again once its filter
+    is older than WP_API_SLUG_FILTER_REFRESH, unless another thread
+    is sweeping them, in a background thread by default. After a
+    failed sweep, the next one waits a minute, doubled after every
+    failure up to the refresh interval. Returns the current filter,
+    None if there is none yet.
+    """
+    now = time.time()
+    refresh = getattr(settings, 'WP_API_SLUG_FILTER_REFRESH', 60 * 60)
+    known = _filters.get(connector.namespace)
+    if known is not None and now - known.built_at <= refresh:
+        return known
+    failures, failed_at = _failures.get(connector.namespace, (0, 0))
+    if failures and now - failed_at < min(60 * 2 ** (failures - 1), refresh):
+        return known
+    if _filters_lock.acquire(False):
+        if background:
+            thread = threading.Thread(
+                target=_sweep, args=(connector, failures),
+                name='wordpress_api-slugs')
+            thread.daemon = True
+            thread.start()
+        else:
+            _sweep(connector, failures)
+    return _filters.get(connector.namespace)
+
+
+def is_known_slug(connector, slug):
+    """
+    Returns False only if the slug is surely not a post of the
+    connector language. Every slug is let through until the filter
+    is built by a background thread, or when building it failed.
+    With WP_API_PREFETCH_ON_STARTUP, the prefetch thread sweeps the
+    slugs instead.
+    """
+    now = time.time()
+    if getattr(settings, 'WP_API_PREFETCH_ON_STARTUP', False):
+        known = _filters.get(connector.namespace)
+    else:
+        known = refresh_known_slugs(connector)
+    if known is None:
+        return True
+    if slug in known:
+        return True
+    probe_interval = getattr(
+        settings, 'WP_API_SLUG_FILTER_PROBE_INTERVAL', 60)
+    if now - known.last_probe < probe_interval:
+        return False
+    known.last_probe = now
+    latest = connector.get_post_slugs(max_pages=1)
+    if 'server_error' in latest:
+        return True
+    known.add(latest)
+    return slug in known
+
+
+def clear_known_slugs():
+    with _filters_lock:
+        _filters.clear()
+        _failures.clear()
@@ -0,0 +1,156 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from requests.exceptions import ConnectionError
+from . import deadline
+from .caching import LRUCache
+
+CLUSTER_KEY = 'wp_api_bulkhead_inflight'
+
+
+class BulkheadFull(ConnectionError):
+    """
+    Raised when a request to wordpress is shed. It is a
+    ConnectionError, so the connector turns it into a server_error
+    like an unreachable server.
+    """
+
+
+class Bulkhead(object):
+    """
+    Limits the requests to wordpress made at once by the process to
+    concurrency. Up to queue requests wait at most timeout seconds,
+    or until the request deadline, for a free slot, the rest are
+    shed at once. With cluster_concurrency, the requests in flight
+    of every process are also counted in the django cache.
+
+    The last good response of every request is kept, so a shed
+    request is answered with stale content when there is some.
+    """
+
+    def __init__(self, concurrency, queue=0, timeout=1,
+                 cluster_concurrency=None, cluster_ttl=60, stale_size=100):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.cluster_concurrency = cluster_concurrency
+        self.cluster_ttl = cluster_ttl
+        self.stale = LRUCache(stale_size)
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        timeout = self.timeout
+        left = deadline.remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+        expiry = time.time() + timeout
+        with self._condition:
+            if self.active >= self.concurrency:
+                if self.waiting >= self.queue:
+                    raise BulkheadFull('Too many requests to wordpress')
+                self.waiting += 1
+                try:
+                    while self.active >= self.concurrency:
+                        remaining = expiry - time.time()
+                        if remaining <= 0:
+                            raise BulkheadFull(
+                                'Timed out waiting for a wordpress slot')
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        if self.cluster_concurrency and not self._cluster_acquire():
+            self._release_local()
+            raise BulkheadFull('Too many requests to wordpress in the cluster')
+
+    def release(self):
+        if self.cluster_concurrency:
+            try:
+                if cache.decr(CLUSTER_KEY) < 0:
+                    # The counter expired and was created again while
+                    # this request was in flight.
+                    cache.incr(CLUSTER_KEY)
+            except ValueError:  # the counter expired
+                pass
+        self._release_local()
+
+    def _release_local(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def _cluster_acquire(self):
+        # The counter expires cluster_ttl seconds after the last
+        # acquire, so slots leaked by killed processes are recovered
+        # once the cluster is idle. incr keeps the expiry of the key,
+        # touch pushes it back (Django 2.1 and later).
+        cache.add(CLUSTER_KEY, 0, self.cluster_ttl)
+        try:
+            inflight = cache.incr(CLUSTER_KEY)
+        except ValueError:
+            cache.add(CLUSTER_KEY, 1, self.cluster_ttl)
+            return True
+        touch = getattr(cache, 'touch', None)
+        if touch is not None:
+            touch(CLUSTER_KEY, self.cluster_ttl)
+        if inflight > self.cluster_concurrency:
+            cache.decr(CLUSTER_KEY)
+            return False
+        return True
+
+    def call(self, key, send):
+        """
+        Returns send() if a slot is free, the stale response of key
+        otherwise. BulkheadFull is raised without a stale response.
+        """
+        try:
+            self.acquire()
+        except BulkheadFull:
+            stale = self.stale.get(key)
+            if stale is None:
+                raise
+            return stale
+        try:
+            response = send()
+        finally:
+            self.release()
+        if response.status_code == 200:
+            self.stale.set(key, response)
+        return response
+
+
+_bulkhead = None
+
+
+def get_bulkhead():
+    """
+    Returns the process wide bulkhead, None unless
+    WP_API_BULKHEAD_CONCURRENCY is set.
+    """
+    global _bulkhead
+    concurrency = getattr(settings, 'WP_API_BULKHEAD_CONCURRENCY', None)
+    if not concurrency:
+        return None
+    if _bulkhead is None:
+        _bulkhead = Bulkhead(
+            concurrency,
+            queue=getattr(settings, 'WP_API_BULKHEAD_QUEUE', concurrency),
+            timeout=getattr(settings, 'WP_API_BULKHEAD_TIMEOUT', 1),
+            cluster_concurrency=getattr(
+                settings, 'WP_API_BULKHEAD_CLUSTER_CONCURRENCY', None),
+            stale_size=getattr(settings, 'WP_API_BULKHEAD_STALE_SIZE', 100))
+    return _bulkhead
+
+
+def reset_bulkhead(**kwargs):
+    global _bulkhead
+    if kwargs.get('setting') is None or\
+       kwargs['setting'].startswith('WP_API_BULKHEAD_'):
+        _bulkhead = None
+
+
+setting_changed.connect(reset_bulkhead)
@@ -0,0 +1,238 @@
+import math
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from . import timing
+from .metrics import get_exporter
+
+
+_local = threading.local()
+
+
+class CachedValue(namedtuple('CachedValue', 'value delta expires')):
+    """
+    Value stored by cache_add with early expiration, with the
+    seconds it took to compute and its expiry time.
+    """
+    __slots__ = ()
+
+
+def early_expiration():
+    """
+    The beta of the early expiration, WP_API_CACHE_EARLY_EXPIRATION.
+    None or 0 disables it.
+    """
+    return getattr(settings, 'WP_API_CACHE_EARLY_EXPIRATION', None)
+
+
+def expires_early(cached, beta):
+    """
+    True if the value should be computed again already. The
+    chance grows as the expiry time nears, and sooner for values
+    that are slow to compute, so usually a single process refreshes
+    a hot key before it expires.
+    """
+    if cached.expires is None:
+        return False
+    return time.time() - cached.delta * beta *\
+        math.log(1 - random.random()) >= cached.expires
+
+
+def _pending():
+    pending = getattr(_local, 'pending', None)
+    if pending is None or len(pending) > 256:
+        pending = _local.pending = {}
+    return pending
+
+
+def cache_get(key, family, stale=False):
+    """
+    cache.get that records a hit or a miss for the
+    given key family in the metrics and the request timer.
+    Values that expire early are a miss, and the time of every
+    miss is kept until cache_add stores the new value. With stale,
+    returns the value and the value that expires early, which is
+    still valid and may be served when computing it again fails.
+    """
+    with timing.phase('cache'):
+        value = cache.get(key)
+    early = False
+    previous = None
+    if isinstance(value, CachedValue):
+        early = expires_early(value, early_expiration() or 0)
+        if early:
+            previous, value = value.value, None
+        else:
+            value = value.value
+    if value is None:
+        _pending()[key] = (time.time(), early)
+    get_exporter().record_cache(family, value is not None)
+    timer = timing.current()
+    if timer is not None:
+        timer.cache_lookups.append((family, value is not None))
+    if stale:
+        return value, previous
+    return value
+
+
+def cache_keep(key):
+    """
+    Forgets the miss of key when its value that expires early is
+    served instead of a new one, so the cached value is kept as is.
+    """
+    _pending().pop(key, None)
+
+
+def cached(key, family, compute, timeout):
+    """
+    Returns the cached value of key, else compute() stored with
+    cache_add. timeout may be a function of the computed value. When
+    a value that expires early fails to compute again, compute
+    raising, the cached value is returned and kept.
+    """
+    value, previous = cache_get(key, family, stale=True)
+    if value is not None:
+        return value
+    try:
+        value = compute()
+    except Exception:
+        if previous is None:
+            raise
+        cache_keep(key)
+        return previous
+    cache_add(key, value, timeout(value) if callable(timeout) else timeout)
+    return value
+
+
+def cache_timeout(resource, default, age=None, ttls=None):
+    """
+    Returns the timeout of the cache entries of a resource in ttls,
+    WP_API_CACHE_TTLS by default, or default if it has none. The
+    timeout of a resource is a number of seconds, or a list of
+    (min_age, timeout) rules where the first rule whose min_age the
+    age of the entry, in seconds, reaches applies.
+    """
+    if ttls is None:
+        ttls = getattr(settings, 'WP_API_CACHE_TTLS', {})
+    timeout = ttls.get(resource, default)
+    if not isinstance(timeout, (list, tuple)):
+        return timeout
+    age = age or 0
+    for min_age, rule_timeout in timeout:
+        if age >= min_age:
+            return rule_timeout
+    return default
+
+
+# Prefix of the cache keys of the keys added by cache_add, with
+# their expiry time. The registry is split in shards, so each stays
+# far below the item size limit of memcached, and concurrent adds
+# seldom rewrite the same shard.
+REGISTRY_KEY = 'wp_api_cache_registry'
+REGISTRY_SHARDS = 64
+# Kept in the cache while it holds the registry. Its absence means
+# the cache lost its entries, as after a restart of memcached.
+SENTINEL_KEY = 'wp_api_cache_registry_sentinel'
+
+
+def registry_key(key):
+    """
+    Returns the cache key of the registry shard of key.
+    """
+    shard = (zlib.crc32(key.encode('utf-8')) & 0xffffffff) % REGISTRY_SHARDS
+    return '{}_{}'.format(REGISTRY_KEY, shard)
+
+
+def registry_keys():
+    return ['{}_{}'.format(REGISTRY_KEY, shard)
+            for shard in range(REGISTRY_SHARDS)]
+
+
+def snapshots_enabled():
+    return bool(getattr(settings, 'WP_API_CACHE_SNAPSHOT', None))
+
+
+def cache_add(key, value, timeout):
+    """
+    cache.add that also registers the key and its expiry time for
+    the cache snapshots, when WP_API_CACHE_SNAPSHOT is set. With
+    WP_API_CACHE_EARLY_EXPIRATION, the value is stored with the time
+    it took to compute since the miss of cache_get, and values
+    refreshed before they expire replace the current ones.
+    """
+    start, early = _pending().pop(key, (None, False))
+    beta = early_expiration()
+    if beta and timeout is not None and timeout > 0:
+        now = time.time()
+        value = CachedValue(
+            value, 0 if start is None else now - start, now + timeout)
+    if early:
+        cache.set(key, value, timeout)
+        added = True
+    else:
+        added = cache.add(key, value, timeout)
+    if added and snapshots_enabled() and (timeout is None or timeout > 0):
+        now = time.time()
+        shard = registry_key(key)
+        registry = cache.get(shard) or {}
+        registry = dict(
+            (registered, expires)
+            for registered, expires in registry.items()
+            if expires is None or expires > now)
+        registry[key] = None if timeout is None else now + timeout
+        cache.set(shard, registry, None)
+    return added
+
+
+class LRUCache(object):
+    """
+    Small thread safe in-process cache with a bounded number of
+    entries. The least recently used entry is evicted first.
+    Timeouts follow the django cache semantics: None never expires
+    and 0 does not store the value at all.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return default
+            self._data[key] = self._data.pop(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if self.maxsize <= 0 or (timeout is not None and timeout <= 0):
+            return
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
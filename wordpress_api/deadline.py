@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+from requests.exceptions import Timeout
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Timeout):
+    """
+    Raised instead of sending a request to wordpress once the
+    deadline of the current request has passed.
+    """
+
+
+@contextmanager
+def request_deadline(seconds):
+    """
+    Every wordpress request made inside the block has to finish
+    within seconds. Nested deadlines never extend the outer one.
+    """
+    previous = getattr(_local, 'deadline', None)
+    deadline = time.time() + seconds
+    if previous is not None:
+        deadline = min(deadline, previous)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """
+    Returns the seconds left to the deadline, None without one.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def get_timeout(default=30):
+    """
+    Returns the timeout of the next wordpress request, the default
+    shrunk to the time left. Raises DeadlineExceeded if none is left.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded('The request deadline has passed')
+    return min(default, left)
+
+
+def has_budget(seconds):
+    """
+    True if there is no deadline or more than seconds are left,
+    used to skip optional work close to the deadline.
+    """
+    left = remaining()
+    return left is None or left > seconds
+
+
+def bind(function):
+    """
+    Returns function running under the deadline of the calling
+    thread, for the requests sent from worker threads.
+    """
+    captured = getattr(_local, 'deadline', None)
+
+    def bound(*args, **kwargs):
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = captured
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.deadline = previous
+    return bound
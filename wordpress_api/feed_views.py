@@ -1,10 +1,41 @@
+from collections import namedtuple
 import iso8601
 from django.contrib.syndication.views import Feed
-from django.conf import settings
-from django.utils.translation import get_language
 from django.http import Http404
-from django.urls import reverse
-from .utils import WPApiConnector
+from . import timing
+from .profiling import profiled
+from .sites import site_for_request, site_reverse
+from .utils import get_blog_language, get_connector
+
+
+def trim_excerpt(excerpt):
+    """
+    Removes the 'Continue reading' link at the end of an excerpt.
+    Rendered excerpts, {'rendered': '...'}, are trimmed as well.
+    """
+    if isinstance(excerpt, dict):
+        excerpt['rendered'] = trim_excerpt(excerpt.get('rendered'))
+        return excerpt
+    if excerpt is not None:
+        position = excerpt.find('Continue reading')
+        if position != -1:
+            excerpt = excerpt[:position]
+    return excerpt
+
+
+def rendered(field):
+    if isinstance(field, dict):
+        return field.get('rendered', '')
+    return field
+
+
+class FeedRequest(namedtuple('FeedRequest', 'request site language')):
+    """
+    The request, site and language of a feed. The feed is created
+    once in the urlconf and shared by every request, so they are
+    passed around as the feed object instead of kept on it.
+    """
+    __slots__ = ()
 
 
 class LatestEntriesFeed(Feed):
@@ -12,6 +43,13 @@ class LatestEntriesFeed(Feed):
     title = "Latest blog entries"
     description = "Latest blog entries"
     link = '/blog/'
+    wp_site = None
+
+    def get_object(self, request, *args, **kwargs):
+        return FeedRequest(
+            request, site_for_request(
+                request, kwargs.get('wp_site', self.wp_site)),
+            get_blog_language())
 
     def get_wp_api_kwargs(self, **kwargs):
         wp_api = {
@@ -20,7 +58,12 @@ class LatestEntriesFeed(Feed):
         return wp_api
 
     def get_context_data(self, **kwargs):
-        connector = WPApiConnector(lang=self.blog_language)
+        if 'item' in kwargs:
+            # Django asks for the context of every item, which must
+            # not fetch the posts again.
+            return super(LatestEntriesFeed, self).get_context_data(**kwargs)
+        feed = kwargs['obj']
+        connector = get_connector(feed.language, feed.site)
         api_kwargs = self.get_wp_api_kwargs(**kwargs)
         page = api_kwargs.get('page_number', 1)
         search = api_kwargs.get('search', '')
@@ -35,14 +78,11 @@ class LatestEntriesFeed(Feed):
             raise Http404
         if not blogs['body']:
             raise Http404
-        for blog in blogs['body']:
-            if blog['excerpt'] is not None:
-                position = blog['excerpt'].find(
-                    'Continue reading')
-                if position != -1:
-                    blog['excerpt'] = blog['excerpt'][:position]
-            blog['slug'] = str(blog['slug'])
-            blog['bdate'] = iso8601.parse_date(blog['date']).date()
+        with timing.phase('postprocess'):
+            for blog in blogs['body']:
+                blog['excerpt'] = trim_excerpt(blog['excerpt'])
+                blog['slug'] = str(blog['slug'])
+                blog['bdate'] = iso8601.parse_date(blog['date']).date()
         context = {
             'blogs': blogs['body'],
             'tags': tags,
@@ -56,24 +96,25 @@ class LatestEntriesFeed(Feed):
         }
         return context
 
-    def items(self):
-        try:
-            allow_language = settings.WP_API_ALLOW_LANGUAGE
-            if allow_language:
-                self.blog_language = str(get_language())
-            else:
-                self.blog_language = 'en'
-        except AttributeError:
-            self.blog_language = 'en'
-        return self.get_context_data()['blogs']
+    def items(self, obj):
+        # Django passes obj only to methods taking it, which the
+        # profiled wrapper hides.
+        return self.get_items(obj)
+
+    @profiled
+    def get_items(self, obj):
+        return [
+            dict(blog, link=site_reverse(
+                obj.request, 'wordpress_api_blog_detail',
+                args=[blog['slug']]))
+            for blog in self.get_context_data(obj=obj)['blogs']]
 
     def item_title(self, item):
-        return item['title']
+        return rendered(item['title'])
 
     def item_description(self, item):
-        return item['excerpt']
+        return rendered(item['excerpt'])
 
     # item_link is only needed if NewsItem has no get_absolute_url method.
     def item_link(self, item):
-        return reverse(
-            'wordpress_api_blog_detail', args=[item['slug']])
+        return item['link']
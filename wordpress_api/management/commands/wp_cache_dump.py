@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from wordpress_api.snapshots import dump_cache, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Writes the blog cache entries to a snapshot file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            help='Snapshot file, WP_API_CACHE_SNAPSHOT by default.')
+
+    def handle(self, *args, **options):
+        path = options['path'] or snapshot_path()
+        if not path:
+            raise CommandError(
+                'Give a snapshot file or set WP_API_CACHE_SNAPSHOT.')
+        saved = dump_cache(path)
+        self.stdout.write('Saved {} cache entries to {}'.format(saved, path))
@@ -0,0 +1,23 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from wordpress_api.snapshots import load_cache, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Restores the blog cache entries of a snapshot file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            help='Snapshot file, WP_API_CACHE_SNAPSHOT by default.')
+
+    def handle(self, *args, **options):
+        path = options['path'] or snapshot_path()
+        if not path:
+            raise CommandError(
+                'Give a snapshot file or set WP_API_CACHE_SNAPSHOT.')
+        if not os.path.exists(path):
+            raise CommandError('{} does not exist.'.format(path))
+        restored = load_cache(path)
+        self.stdout.write(
+            'Restored {} cache entries from {}'.format(restored, path))
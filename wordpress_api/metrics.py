@@ -0,0 +1,154 @@
+import bisect
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50)
+
+
+class NullExporter(object):
+    """
+    Default exporter, it ignores every measure.
+    Custom exporters should implement the same methods.
+    """
+
+    def record_request(self, endpoint, status, latency, size):
+        pass
+
+    def record_pages(self, endpoint, pages):
+        pass
+
+    def record_cache(self, family, hit):
+        pass
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                name, labels, bound, cumulative))
+        labels = labels.rstrip(',')
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+
+class PrometheusExporter(NullExporter):
+    """
+    Aggregates the measures in memory and renders them
+    in the prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.size = {}
+        self.pages = {}
+        self.cache = defaultdict(int)
+
+    def _observe(self, histograms, key, buckets, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def record_request(self, endpoint, status, latency, size):
+        with self._lock:
+            self._observe(
+                self.latency, (endpoint, str(status)), LATENCY_BUCKETS,
+                latency)
+            self._observe(self.size, (endpoint,), SIZE_BUCKETS, size)
+
+    def record_pages(self, endpoint, pages):
+        with self._lock:
+            self._observe(self.pages, (endpoint,), PAGE_BUCKETS, pages)
+
+    def record_cache(self, family, hit):
+        with self._lock:
+            self.cache[(family, 'hit' if hit else 'miss')] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP wordpress_api_upstream_request_seconds '
+                'Latency of the requests to wordpress.',
+                '# TYPE wordpress_api_upstream_request_seconds histogram',
+            ]
+            for (endpoint, status), histogram in sorted(self.latency.items()):
+                lines += histogram.render(
+                    'wordpress_api_upstream_request_seconds',
+                    'endpoint="{}",status="{}",'.format(endpoint, status))
+            lines += [
+                '# HELP wordpress_api_upstream_response_bytes '
+                'Size of the responses of wordpress.',
+                '# TYPE wordpress_api_upstream_response_bytes histogram',
+            ]
+            for (endpoint,), histogram in sorted(self.size.items()):
+                lines += histogram.render(
+                    'wordpress_api_upstream_response_bytes',
+                    'endpoint="{}",'.format(endpoint))
+            lines += [
+                '# HELP wordpress_api_upstream_pages '
+                'Pages fetched by each connector call.',
+                '# TYPE wordpress_api_upstream_pages histogram',
+            ]
+            for (endpoint,), histogram in sorted(self.pages.items()):
+                lines += histogram.render(
+                    'wordpress_api_upstream_pages',
+                    'endpoint="{}",'.format(endpoint))
+            lines += [
+                '# HELP wordpress_api_cache_requests_total '
+                'Cache lookups by key family and result.',
+                '# TYPE wordpress_api_cache_requests_total counter',
+            ]
+            for (family, result), count in sorted(self.cache.items()):
+                lines.append(
+                    'wordpress_api_cache_requests_total'
+                    '{{family="{}",result="{}"}} {}'.format(
+                        family, result, count))
+        return '\n'.join(lines) + '\n'
+
+
+_exporter = None
+
+
+def get_exporter():
+    """
+    Returns the exporter configured in WP_API_METRICS_EXPORTER,
+    a dotted path to an exporter class.
+    """
+    global _exporter
+    if _exporter is None:
+        path = getattr(settings, 'WP_API_METRICS_EXPORTER', None)
+        _exporter = import_string(path)() if path else NullExporter()
+    return _exporter
+
+
+def reset_exporter(**kwargs):
+    global _exporter
+    if kwargs.get('setting') in (None, 'WP_API_METRICS_EXPORTER'):
+        _exporter = None
+
+
+setting_changed.connect(reset_exporter)
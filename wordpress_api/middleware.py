@@ -0,0 +1,132 @@
+import json
+import logging
+import random
+from collections import defaultdict
+from django.conf import settings
+from django.template.loader import render_to_string
+from . import timing
+from .deadline import request_deadline
+
+logger = logging.getLogger('wordpress_api.timing')
+
+
+class ServerTimingMiddleware(object):
+    """
+    Attributes the time of the sampled requests to cache lookups,
+    wordpress requests, post processing and template rendering.
+    The breakdown is sent in a Server-Timing header and logged
+    to the wordpress_api.timing logger.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'WP_API_TIMING_SAMPLE_RATE', 1.0)
+        if sample_rate < 1 and random.random() >= sample_rate:
+            return self.get_response(request)
+        timer = timing.current()
+        own_timer = timer is None
+        if own_timer:
+            timer = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            if own_timer:
+                timing.stop()
+        total = timer.elapsed()
+        if getattr(settings, 'WP_API_SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = timer.server_timing(total)
+        logger.info(json.dumps({
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'phases': dict(
+                (name, round(duration * 1000, 1))
+                for name, (duration, count) in timer.phases.items()),
+            'cache_hits': sum(hit for family, hit in timer.cache_lookups),
+            'cache_misses': sum(
+                not hit for family, hit in timer.cache_lookups),
+        }, sort_keys=True))
+        return response
+
+
+class DeadlineMiddleware(object):
+    """
+    Gives the wordpress requests made to serve every request
+    WP_API_REQUEST_DEADLINE seconds in total.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        seconds = getattr(settings, 'WP_API_REQUEST_DEADLINE', None)
+        if seconds is None:
+            return self.get_response(request)
+        with request_deadline(seconds):
+            return self.get_response(request)
+
+
+def analyze_calls(calls):
+    """
+    Flags the calls made twice with the same url as duplicates, and
+    the connector methods called with different filters in the same
+    request, like the related posts of BlogView, as N+1 patterns.
+    """
+    urls = defaultdict(int)
+    filters = defaultdict(set)
+    for call in calls:
+        if call['cached']:
+            continue
+        urls[call['url']] += 1
+        filters[call['method']].add(frozenset(
+            (key, str(value)) for key, value in call['params'].items()
+            if key != 'page'))
+    for call in calls:
+        call['duplicate'] = not call['cached'] and urls[call['url']] > 1
+        call['n_plus_one'] = not call['cached'] and\
+            len(filters[call['method']]) > 1
+    return calls
+
+
+class DebugOverlayMiddleware(object):
+    """
+    When DEBUG is on, appends to every html page a table with
+    the wordpress requests made while serving it.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+        timer = timing.current()
+        own_timer = timer is None
+        if own_timer:
+            timer = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            if own_timer:
+                timing.stop()
+        content_type = response.get('Content-Type', '')
+        if getattr(response, 'streaming', False) or\
+           not content_type.startswith('text/html') or\
+           not timer.upstream_calls:
+            return response
+        calls = analyze_calls(timer.upstream_calls)
+        overlay = render_to_string('wordpress_api/debug_overlay.html', {
+            'calls': calls,
+            'total_time': sum(call['time'] for call in calls),
+            'total_bytes': sum(call['bytes'] for call in calls),
+            'duplicates': sum(call['duplicate'] for call in calls),
+            'n_plus_one': any(call['n_plus_one'] for call in calls),
+        })
+        content = response.content.decode(response.charset)
+        position = content.rfind('</body>')
+        if position == -1:
+            position = len(content)
+        response.content = content[:position] + overlay + content[position:]
+        return response
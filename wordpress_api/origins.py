@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.signals import setting_changed
+from requests.exceptions import ConnectionError, Timeout
+from six.moves import queue
+from . import deadline
+from .retry import RetryBudget
+
+
+class Origin(object):
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+
+class OriginPool(object):
+    """
+    Wordpress nodes serving the same blog. Requests go to the
+    healthy node with the lowest latency, an exponentially weighted
+    moving average of its response times, and fail over to the next
+    one on connection errors, timeouts and 5xx responses. A node
+    failing max_failures times in a row is left out for cooldown
+    seconds.
+
+    With hedge_delay, seconds or 'p95' of the recent response times,
+    a request still running after the delay is also sent to the next
+    node and the first answer wins. hedge_budget, a RetryBudget,
+    bounds the extra requests.
+    """
+
+    def __init__(self, urls, alpha=0.3, max_failures=2, cooldown=30,
+                 hedge_delay=None, hedge_budget=None):
+        self.origins = [Origin(url) for url in urls]
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.hedge_delay = hedge_delay
+        self.hedge_budget = RetryBudget() if hedge_budget is None else\
+            hedge_budget
+        self.latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        """
+        Returns the healthy origins, fastest first, followed by the
+        unhealthy ones, the soonest back first. Origins without a
+        measure yet come first so they get one.
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [origin for origin in self.origins
+                       if origin.healthy(now)]
+            down = [origin for origin in self.origins
+                    if not origin.healthy(now)]
+        healthy.sort(key=lambda origin: origin.latency or 0)
+        down.sort(key=lambda origin: origin.down_until)
+        return healthy + down
+
+    def succeeded(self, origin, elapsed):
+        with self._lock:
+            self.latencies.append(elapsed)
+            origin.failures = 0
+            origin.down_until = 0
+            if origin.latency is None:
+                origin.latency = elapsed
+            else:
+                origin.latency += self.alpha * (elapsed - origin.latency)
+
+    def failed(self, origin):
+        with self._lock:
+            origin.failures += 1
+            if origin.failures >= self.max_failures:
+                origin.down_until = time.time() + self.cooldown
+
+    def hedge_after(self):
+        """
+        Seconds after which a request is hedged, None to not hedge.
+        """
+        if self.hedge_delay != 'p95':
+            return self.hedge_delay
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < 20:
+            return None
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def call(self, send):
+        """
+        Returns send(url) of the first origin that answers. When
+        every origin fails, the last 5xx response is returned or the
+        last error raised.
+        """
+        delay = self.hedge_after() if len(self.origins) > 1 else None
+        if delay is not None:
+            return self._hedged_call(send, delay)
+        response = error = None
+        for origin in self.ordered():
+            response, error = self._attempt(origin, send)
+            if error is None and response.status_code < 500:
+                return response
+        if response is not None:
+            return response
+        raise error
+
+    def _attempt(self, origin, send):
+        """
+        Returns the (response, error) of send(origin.url) and
+        records the health of the origin.
+        """
+        start = time.time()
+        try:
+            response = send(origin.url)
+        except deadline.DeadlineExceeded:
+            raise
+        except (ConnectionError, Timeout) as error:
+            self.failed(origin)
+            return None, error
+        if response.status_code >= 500:
+            self.failed(origin)
+        else:
+            self.succeeded(origin, time.time() - start)
+        return response, None
+
+    def _hedged_call(self, send, delay):
+        self.hedge_budget.deposit()
+        origins = self.ordered()
+        results = queue.Queue()
+        send = deadline.bind(send)
+
+        def attempt(origin):
+            try:
+                results.put(self._attempt(origin, send))
+            except Exception as error:
+                results.put((None, error))
+
+        def start(origin):
+            thread = threading.Thread(target=attempt, args=(origin,))
+            thread.daemon = True
+            thread.start()
+        start(origins[0])
+        pending, started = 1, 1
+        try:
+            result = results.get(timeout=delay)
+        except queue.Empty:
+            result = None
+            if self.hedge_budget.withdraw():
+                start(origins[1])
+                pending, started = 2, 2
+        response = error = None
+        while pending:
+            if result is None:
+                result = results.get()
+            pending -= 1
+            last_response, last_error = result
+            result = None
+            if last_error is None and last_response.status_code < 500:
+                return last_response
+            if last_error is not None and\
+               not isinstance(last_error, (ConnectionError, Timeout)) or\
+               isinstance(last_error, deadline.DeadlineExceeded):
+                raise last_error
+            response = last_response or response
+            error = last_error or error
+            if not pending and started < len(origins):
+                start(origins[started])
+                pending, started = 1, started + 1
+        if response is not None:
+            return response
+        raise error
+
+
+_pool = None
+
+
+def build_origin_pool(urls):
+    """
+    Returns an origin pool of the given urls configured by the
+    WP_API_ORIGIN_ and WP_API_HEDGE_ settings.
+    """
+    return OriginPool(
+        urls,
+        alpha=getattr(settings, 'WP_API_ORIGIN_EWMA_ALPHA', 0.3),
+        max_failures=getattr(settings, 'WP_API_ORIGIN_MAX_FAILURES', 2),
+        cooldown=getattr(settings, 'WP_API_ORIGIN_COOLDOWN', 30),
+        hedge_delay=getattr(settings, 'WP_API_HEDGE_DELAY', None),
+        hedge_budget=RetryBudget(
+            ratio=getattr(settings, 'WP_API_HEDGE_BUDGET_RATIO', 0.05),
+            capacity=getattr(settings, 'WP_API_HEDGE_BUDGET_CAPACITY', 10)))
+
+
+def get_origin_pool():
+    """
+    Returns the process wide origin pool, None unless WP_URLS
+    lists more than one wordpress url.
+    """
+    global _pool
+    urls = getattr(settings, 'WP_URLS', None)
+    if not urls or len(urls) < 2:
+        return None
+    if _pool is None:
+        _pool = build_origin_pool(urls)
+    return _pool
+
+
+def reset_origin_pool(**kwargs):
+    global _pool
+    if kwargs.get('setting') is None or kwargs['setting'] == 'WP_URLS' or\
+       kwargs['setting'].startswith(('WP_API_ORIGIN_', 'WP_API_HEDGE_')):
+        _pool = None
+
+
+setting_changed.connect(reset_origin_pool)
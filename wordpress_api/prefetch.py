@@ -0,0 +1,102 @@
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from .bloom import refresh_known_slugs, slug_filter_enabled
+from .search import (
+    get_search_index, local_search_enabled, search_refresh_interval)
+from .sites import DEFAULT_SITE
+from .utils import get_connector
+
+logger = logging.getLogger('wordpress_api.prefetch')
+
+
+def prefetch_enabled():
+    return getattr(settings, 'WP_API_PREFETCH_ON_STARTUP', False)
+
+
+def prefetch_languages():
+    """
+    WP_API_PREFETCH_LANGUAGES, or the LANGUAGES of the project when
+    WP_API_ALLOW_LANGUAGE is set, english otherwise.
+    """
+    languages = getattr(settings, 'WP_API_PREFETCH_LANGUAGES', None)
+    if languages is not None:
+        return list(languages)
+    if getattr(settings, 'WP_API_ALLOW_LANGUAGE', False):
+        return [code for code, name in settings.LANGUAGES]
+    return ['en']
+
+
+def prefetch_taxonomies(workers=4, max_age=0):
+    """
+    Loads the taxonomies of every site and language in the shared
+    connectors, in a pool of threads, unless they were loaded less
+    than max_age seconds ago. Stale local search indexes and slug
+    filters are built again too. Returns the connectors.
+    """
+    sites = [DEFAULT_SITE] + sorted(getattr(settings, 'WP_API_SITES', {}))
+    pairs = [(site, lang) for site in sites for lang in prefetch_languages()]
+
+    def prefetch(pair):
+        site, lang = pair
+        try:
+            connector = get_connector(lang, site)
+            connector.refresh_taxonomies(max_age)
+            if local_search_enabled() and not get_search_index(
+                    connector.namespace).is_fresh(search_refresh_interval()):
+                connector.refresh_search_index(background=False)
+            if slug_filter_enabled():
+                refresh_known_slugs(connector, background=False)
+        except Exception:
+            logger.exception('Prefetch of %s %s failed', site, lang)
+            return None
+        if connector.taxonomies.failed:
+            logger.warning('Prefetch of %s %s failed', site, lang)
+        return connector
+
+    pool = ThreadPool(min(workers, len(pairs)))
+    try:
+        return pool.map(prefetch, pairs)
+    finally:
+        pool.close()
+
+
+class Prefetcher(threading.Thread):
+    """
+    Daemon thread prefetching the taxonomies at once and then
+    every interval seconds, until stop is called.
+    """
+
+    def __init__(self, interval, workers=4):
+        super(Prefetcher, self).__init__(name='wordpress_api-prefetch')
+        self.daemon = True
+        self.interval = interval
+        self.workers = workers
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            # Snapshots loaded by the previous run are refreshed,
+            # the ones just loaded by get_connector are not.
+            prefetch_taxonomies(self.workers, self.interval / 2.0)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+_prefetcher = None
+
+
+def start_prefetch():
+    """
+    Starts the prefetch thread of the process, once.
+    """
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher(
+            getattr(settings, 'WP_API_PREFETCH_INTERVAL', 300),
+            getattr(settings, 'WP_API_PREFETCH_WORKERS', 4))
+        _prefetcher.start()
+    return _prefetcher
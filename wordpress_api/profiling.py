@@ -0,0 +1,114 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from django.conf import settings
+from . import timing
+
+logger = logging.getLogger('wordpress_api.profiling')
+_local = threading.local()
+# A single profile runs at a time in the process, cProfile hooks are
+# interpreter wide since python 3.12.
+_profiler_lock = threading.Lock()
+
+
+def write_profile(profiler, name, metadata):
+    """
+    Dumps the profile and its metadata to WP_API_PROFILE_DIR,
+    keeping only the newest WP_API_PROFILE_KEEP profiles.
+    """
+    directory = settings.WP_API_PROFILE_DIR
+    keep = getattr(settings, 'WP_API_PROFILE_KEEP', 100)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    base = os.path.join(directory, '{:.6f}-{}-{}'.format(
+        time.time(), os.getpid(), name))
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as metadata_file:
+        json.dump(metadata, metadata_file, sort_keys=True)
+    profiles = sorted(
+        filename for filename in os.listdir(directory)
+        if filename.endswith('.prof'))
+    for filename in profiles[:max(len(profiles) - keep, 0)]:
+        for path in (filename, filename[:-5] + '.json'):
+            try:
+                os.remove(os.path.join(directory, path))
+            except OSError:  # pragma: no cover
+                pass
+
+
+def _save_profile(view, name, profiler, args, metadata):
+    """
+    Writes the profile of a call of the method name of view. Errors
+    are logged, a profile never fails the request.
+    """
+    request = getattr(view, 'request', None)
+    if request is None and args:
+        # The feed gets its request in the feed object.
+        request = getattr(args[0], 'request', None)
+    metadata.update({
+        'view': type(view).__name__,
+        'method': name,
+        'path': getattr(request, 'path', None),
+    })
+    try:
+        write_profile(
+            profiler, '{}.{}'.format(type(view).__name__, name), metadata)
+    except Exception:
+        logger.exception('Profile of %s.%s could not be written',
+                         type(view).__name__, name)
+
+
+def profiled(method):
+    """
+    Profiles the decorated method with cProfile when the call is
+    picked by WP_API_PROFILE_SAMPLE_RATE. If WP_API_PROFILE_THRESHOLD
+    is set, every call is profiled and the ones slower than the
+    threshold, in seconds, are kept as well. Calls made while
+    another thread is profiling run unprofiled.
+    Nothing is done unless WP_API_PROFILE_DIR is set.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not getattr(settings, 'WP_API_PROFILE_DIR', None) or\
+           getattr(_local, 'active', False):
+            return method(self, *args, **kwargs)
+        sampled = random.random() < getattr(
+            settings, 'WP_API_PROFILE_SAMPLE_RATE', 0)
+        threshold = getattr(settings, 'WP_API_PROFILE_THRESHOLD', None)
+        if not sampled and threshold is None:
+            return method(self, *args, **kwargs)
+        timer = timing.current()
+        own_timer = timer is None
+        if own_timer:
+            timer = timing.start()
+        profiler = cProfile.Profile()
+        if not _profiler_lock.acquire(False):
+            if own_timer:
+                timing.stop()
+            return method(self, *args, **kwargs)
+        _local.active = True
+        start = time.time()
+        try:
+            return profiler.runcall(method, self, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            _local.active = False
+            _profiler_lock.release()
+            if own_timer:
+                timing.stop()
+            if sampled or elapsed >= threshold:
+                _save_profile(self, name, profiler, args, {
+                    'elapsed': elapsed,
+                    'reason': 'sampled' if sampled else 'slow',
+                    'cache': [
+                        {'family': family, 'hit': hit}
+                        for family, hit in timer.cache_lookups],
+                })
+    return wrapper
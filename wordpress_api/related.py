@@ -0,0 +1,173 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+import iso8601
+from django.conf import settings
+
+EPOCH = iso8601.parse_date('1970-01-01T00:00:00Z')
+# What the related posts of the detail page need, normalize_post
+# included, the rest of a post is not kept.
+POST_FIELDS = ('id', 'slug', 'title', 'excerpt', 'date', 'date_gmt',
+               'author', 'tags', 'categories')
+EMBEDDED_FIELDS = ('author', 'wp:featuredmedia')
+
+
+def local_related_enabled():
+    return getattr(settings, 'WP_API_LOCAL_RELATED_POSTS', False)
+
+
+def post_timestamp(post):
+    date = post.get('date_gmt') or post.get('date')
+    if not date:
+        return None
+    try:
+        parsed = iso8601.parse_date(date)
+    except iso8601.ParseError:
+        return None
+    return (parsed - EPOCH).total_seconds()
+
+
+def slim_post(post):
+    """
+    Returns the fields of post the related posts are rendered with.
+    """
+    slim = {field: post[field] for field in POST_FIELDS if field in post}
+    embedded = {field: value for field, value in
+                (post.get('_embedded') or {}).items()
+                if field in EMBEDDED_FIELDS}
+    if embedded:
+        slim['_embedded'] = embedded
+    return slim
+
+
+class RelatedPostsIndex(object):
+    """
+    Keeps a sparse vector of tags and categories for every fetched post.
+    Related posts are scored by the idf weighted features they share with
+    the given post, decayed by their age with the given half life.
+    Only the max_posts most recent posts are kept.
+    """
+
+    def __init__(self, tag_weight=1.0, category_weight=0.5,
+                 half_life_days=365, max_posts=1000):
+        self.weights = {'tags': tag_weight, 'categories': category_weight}
+        self.half_life = half_life_days * 86400.0
+        self.max_posts = max_posts
+        self.posts = {}
+        self.vectors = {}
+        self.timestamps = {}
+        self.features = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.posts)
+
+    def vector(self, post):
+        vector = {}
+        for field, weight in self.weights.items():
+            for term_id in post.get(field) or []:
+                vector[(field, term_id)] = weight
+        return vector
+
+    def add_post(self, post):
+        if 'id' not in post:
+            return
+        post_id = post['id']
+        vector = self.vector(post)
+        with self._lock:
+            self._remove(post_id)
+            self.posts[post_id] = slim_post(post)
+            self.vectors[post_id] = vector
+            self.timestamps[post_id] = post_timestamp(post)
+            for feature in vector:
+                self.features[feature].add(post_id)
+            excess = len(self.posts) - self.max_posts
+            if excess > 0:
+                oldest = heapq.nsmallest(
+                    excess, self.timestamps,
+                    key=lambda candidate: self.timestamps[candidate] or 0)
+                for candidate in oldest:
+                    self._remove(candidate)
+
+    def _remove(self, post_id):
+        for feature in self.vectors.pop(post_id, ()):
+            self.features[feature].discard(post_id)
+            if not self.features[feature]:
+                del self.features[feature]
+        self.posts.pop(post_id, None)
+        self.timestamps.pop(post_id, None)
+
+    def add_posts(self, posts):
+        for post in posts:
+            if isinstance(post, dict):
+                self.add_post(post)
+
+    def replace_posts(self, posts):
+        """
+        Indexes the posts of a sweep of the whole blog, dropping the
+        posts it no longer returns, deleted or unpublished since.
+        """
+        posts = [post for post in posts
+                 if isinstance(post, dict) and 'id' in post]
+        swept = {post['id'] for post in posts}
+        with self._lock:
+            for post_id in set(self.posts) - swept:
+                self._remove(post_id)
+        self.add_posts(posts)
+
+    def related(self, post, limit=3, now=None):
+        """
+        Returns up to limit posts sharing tags or categories with post,
+        best scored first. The post itself is never returned.
+        """
+        now = time.time() if now is None else now
+        vector = self.vector(post)
+        scores = defaultdict(float)
+        with self._lock:
+            total = len(self.posts) or 1
+            for feature, weight in vector.items():
+                candidates = self.features.get(feature, ())
+                if not candidates:
+                    continue
+                idf = math.log(1.0 + float(total) / len(candidates))
+                for candidate in candidates:
+                    scores[candidate] += weight * idf * \
+                        self.vectors[candidate][feature]
+            scores.pop(post.get('id'), None)
+            for candidate in scores:
+                timestamp = self.timestamps[candidate]
+                if timestamp is not None and self.half_life > 0:
+                    age = max(now - timestamp, 0)
+                    scores[candidate] *= 0.5 ** (age / self.half_life)
+            best = sorted(
+                scores, key=lambda candidate: (
+                    scores[candidate], self.timestamps[candidate] or 0),
+                reverse=True)[:limit]
+            return [dict(self.posts[candidate]) for candidate in best]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_related_index(lang):
+    """
+    Returns the related posts index of the given language,
+    creating it if needed.
+    """
+    index = _indexes.get(lang)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(lang, RelatedPostsIndex(
+                half_life_days=getattr(
+                    settings, 'WP_API_RELATED_POSTS_HALF_LIFE_DAYS', 365),
+                max_posts=getattr(
+                    settings, 'WP_API_RELATED_POSTS_MAX_POSTS', 1000)))
+    return index
+
+
+def clear_related_indexes():
+    with _indexes_lock:
+        _indexes.clear()
@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+from django.conf import settings
+from django.core.signals import setting_changed
+from requests.exceptions import ConnectionError
+from . import deadline
+from .bulkhead import BulkheadFull
+
+
+class RetryBudget(object):
+    """
+    Token bucket bounding the retries to a fraction of the requests.
+    Every request deposits ratio tokens and every retry withdraws
+    one, so an outage is never amplified by more than ratio. The
+    bucket starts full with capacity tokens for the first requests.
+    """
+
+    def __init__(self, ratio=0.1, capacity=10):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def retry_after(response):
+    """
+    Returns the seconds asked by the Retry-After header of the
+    response, in seconds or as an http date, or None.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0, mktime_tz(date) - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Retries the GET requests to wordpress that failed to connect or
+    got a 429 or 5xx response, at most retries times. The waits
+    grow exponentially from backoff up to max_backoff seconds, with
+    full jitter, unless the response has a Retry-After header.
+    Responses asking to wait longer than max_backoff, or past the
+    request deadline, are returned.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, retries=2, backoff=0.1, max_backoff=2, budget=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = RetryBudget() if budget is None else budget
+        self.random = random.Random()
+
+    def delay(self, attempt, response=None):
+        """
+        Seconds to wait before the given retry, None to give up.
+        """
+        if attempt >= self.retries:
+            return None
+        wait = None if response is None else retry_after(response)
+        if wait is None:
+            wait = self.random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        elif wait > self.max_backoff:
+            return None
+        if not deadline.has_budget(wait):
+            return None
+        if not self.budget.withdraw():
+            return None
+        return wait
+
+    def call(self, send):
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = send()
+            except BulkheadFull:
+                raise
+            except ConnectionError:
+                wait = self.delay(attempt)
+                if wait is None:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    return response
+                wait = self.delay(attempt, response)
+                if wait is None:
+                    return response
+            time.sleep(wait)
+            attempt += 1
+
+
+_policy = None
+
+
+def get_retry_policy():
+    """
+    Returns the process wide retry policy, None unless
+    WP_API_RETRIES is set.
+    """
+    global _policy
+    retries = getattr(settings, 'WP_API_RETRIES', 0)
+    if not retries:
+        return None
+    if _policy is None:
+        _policy = RetryPolicy(
+            retries,
+            backoff=getattr(settings, 'WP_API_RETRY_BACKOFF', 0.1),
+            max_backoff=getattr(settings, 'WP_API_RETRY_MAX_BACKOFF', 2),
+            budget=RetryBudget(
+                ratio=getattr(settings, 'WP_API_RETRY_BUDGET_RATIO', 0.1),
+                capacity=getattr(
+                    settings, 'WP_API_RETRY_BUDGET_CAPACITY', 10)))
+    return _policy
+
+
+def reset_retry_policy(**kwargs):
+    global _policy
+    if kwargs.get('setting') is None or\
+       kwargs['setting'].startswith('WP_API_RETR'):
+        _policy = None
+
+
+setting_changed.connect(reset_retry_policy)
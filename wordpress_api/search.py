@@ -0,0 +1,384 @@
+import bisect
+import hashlib
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Field weights used when building the term frequencies of a post.
+FIELD_WEIGHTS = (
+    ('title', 3),
+    ('excerpt', 2),
+    ('content', 1),
+)
+
+
+def local_search_enabled():
+    return getattr(settings, 'WP_API_LOCAL_SEARCH', False)
+
+
+def search_refresh_interval():
+    return getattr(settings, 'WP_API_LOCAL_SEARCH_REFRESH', 3600)
+
+
+def autocomplete_enabled():
+    return getattr(settings, 'WP_API_AUTOCOMPLETE', False)
+
+
+def rendered_text(field):
+    """
+    WordPress returns title, excerpt and content as
+    {'rendered': '<html>'}. Older payloads may send plain strings.
+    """
+    if isinstance(field, dict):
+        field = field.get('rendered', '')
+    if not field:
+        return ''
+    return HTML_TAG_RE.sub(' ', field)
+
+
+def normalize_query(query):
+    """
+    Case folds the query and collapses its whitespace, so
+    equivalent searches share the same cache entry.
+    """
+    if query is None:
+        return ''
+    query = query.casefold() if hasattr(query, 'casefold') else query.lower()
+    return ' '.join(query.split())
+
+
+def search_cache_key(query, page, lang):
+    digest = hashlib.sha1(
+        normalize_query(query).encode('utf-8')).hexdigest()
+    return 'blog_search_cache_{}_{}_page_{}'.format(lang, digest, page)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex(object):
+    """
+    In-process inverted index over the posts fetched from wordpress.
+    Results are ranked with BM25 and every query term must match,
+    like the wordpress search does. built_at is the time of the full
+    sweep of the blog the index was built from, None until then.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.posts = {}
+        self.lengths = {}
+        self.terms = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.posts)
+
+    def is_fresh(self, max_age):
+        """
+        True if the index holds every post of the blog as of less
+        than max_age seconds ago, None never expires.
+        """
+        if self.built_at is None:
+            return False
+        return max_age is None or time.time() - self.built_at < max_age
+
+    def _remove(self, post_id):
+        if post_id not in self.posts:
+            return
+        del self.posts[post_id]
+        self.total_length -= self.lengths.pop(post_id)
+        for term in self.terms.pop(post_id):
+            documents = self.postings[term]
+            del documents[post_id]
+            if not documents:
+                del self.postings[term]
+
+    def add_post(self, post):
+        post_id = post.get('id', post.get('slug'))
+        frequencies = defaultdict(int)
+        length = 0
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(rendered_text(post.get(field))):
+                frequencies[token] += weight
+                length += weight
+        with self._lock:
+            self._remove(post_id)
+            self.posts[post_id] = dict(post)
+            self.lengths[post_id] = length
+            self.terms[post_id] = list(frequencies)
+            self.total_length += length
+            for term, frequency in frequencies.items():
+                self.postings[term][post_id] = frequency
+
+    def add_posts(self, posts):
+        for post in posts:
+            if isinstance(post, dict):
+                self.add_post(post)
+
+    def remove_post(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def search(self, query):
+        """
+        Returns the matching posts, best ranked first.
+        Ties are broken by date, newest first.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            total = len(self.posts)
+            if not total:
+                return []
+            postings = [self.postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            if not postings[0]:
+                return []
+            average_length = float(self.total_length) / total
+            scores = {}
+            for post_id in postings[0]:
+                if not all(post_id in documents for documents in postings):
+                    continue
+                length_norm = self.k1 * (
+                    1 - self.b + self.b * self.lengths[post_id] /
+                    average_length)
+                score = 0.0
+                for documents in postings:
+                    frequency = documents[post_id]
+                    idf = math.log(
+                        1 + (total - len(documents) + 0.5) /
+                        (len(documents) + 0.5))
+                    score += idf * frequency * (self.k1 + 1) / (
+                        frequency + length_norm)
+                scores[post_id] = score
+            results = [self.posts[post_id] for post_id in scores]
+        results.sort(key=lambda post: post.get('date') or '', reverse=True)
+        results.sort(
+            key=lambda post: scores[post.get('id', post.get('slug'))],
+            reverse=True)
+        return results
+
+    def search_page(self, query, page_number=1, per_page=10):
+        """
+        Returns the same structure as WPApiConnector.get_posts
+        so the views can paginate local results as usual.
+        """
+        results = self.search(query)
+        total = len(results)
+        total_pages = int(math.ceil(float(total) / per_page))
+        start = (page_number - 1) * per_page
+        body = [dict(post) for post in results[start:start + per_page]]
+        headers = {
+            'X-WP-Total': str(total),
+            'X-WP-TotalPages': str(total_pages),
+            'request_url': 'local-search?search={}&page={}'.format(
+                query, page_number),
+        }
+        return {'body': body, 'headers': headers, }
+
+
+class PrefixIndex(object):
+    """
+    Sorted array of normalized labels searched with bisect.
+    Every word of a label is indexed, so 'tip' suggests 'Django tips'.
+    Post titles are kept for the max_posts most recently published
+    posts only, whatever the order they are fetched in.
+    New and changed titles are inserted in place, so suggestions
+    never wait for the array to be sorted again.
+    """
+
+    def __init__(self, max_posts=500):
+        self.max_posts = max_posts
+        self.terms = {'tag': {}, 'category': {}}
+        # slug: (publication date, insertion order, label)
+        self.posts = {}
+        self._added = 0
+        self._keys = []
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def has(self, kind):
+        return bool(self.terms.get(kind))
+
+    def update_terms(self, kind, items):
+        """
+        Replaces the indexed tags or categories, unless they did not
+        change.
+        """
+        terms = {}
+        for item in items:
+            if isinstance(item, dict) and 'slug' in item:
+                terms[item['slug']] = item.get('name', item['slug'])
+        with self._lock:
+            if self.terms.get(kind) == terms:
+                return
+            self.terms[kind] = terms
+            self._rebuild()
+
+    def add_posts(self, posts):
+        with self._lock:
+            for post in posts:
+                if not isinstance(post, dict) or 'slug' not in post:
+                    continue
+                label = ' '.join(rendered_text(post.get('title')).split())
+                previous = self.posts.get(post['slug'])
+                self._added += 1
+                self.posts[post['slug']] = (
+                    post.get('date_gmt') or post.get('date') or '',
+                    self._added, label)
+                if previous is None or previous[2] != label:
+                    if previous is not None:
+                        self._remove('post', post['slug'], previous[2])
+                    self._insert('post', post['slug'], label)
+            excess = len(self.posts) - self.max_posts
+            if excess > 0:
+                for slug, (date, added, label) in heapq.nsmallest(
+                        excess, self.posts.items(),
+                        key=lambda item: item[1][:2]):
+                    del self.posts[slug]
+                    self._remove('post', slug, label)
+
+    @staticmethod
+    def _label_entries(kind, slug, label):
+        words = normalize_query(label).split(' ')
+        for position in range(len(words)):
+            key = ' '.join(words[position:])
+            if key:
+                yield (key, kind, slug, label)
+
+    def _insert(self, kind, slug, label):
+        for entry in self._label_entries(kind, slug, label):
+            position = bisect.bisect_left(self._entries, entry)
+            self._entries.insert(position, entry)
+            self._keys.insert(position, entry[0])
+
+    def _remove(self, kind, slug, label):
+        for entry in self._label_entries(kind, slug, label):
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and\
+               self._entries[position] == entry:
+                del self._entries[position]
+                del self._keys[position]
+
+    def _rebuild(self):
+        entries = []
+        posts = dict(
+            (slug, label) for slug, (date, added, label) in self.posts.items())
+        sources = [('post', posts)] + sorted(self.terms.items())
+        for kind, labels in sources:
+            for slug, label in labels.items():
+                entries.extend(self._label_entries(kind, slug, label))
+        entries.sort()
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+
+    def suggest(self, prefix, limit=10):
+        """
+        Returns up to limit dicts with the kind, slug and label
+        of the entries that have a word starting with prefix.
+        """
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+        seen = set()
+        suggestions = []
+        with self._lock:
+            keys, entries = self._keys, self._entries
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(suggestions) < limit:
+                if not keys[position].startswith(prefix):
+                    break
+                key, kind, slug, label = entries[position]
+                position += 1
+                if (kind, slug) in seen:
+                    continue
+                seen.add((kind, slug))
+                suggestions.append(
+                    {'type': kind, 'slug': slug, 'label': label})
+        return suggestions
+
+
+_indexes = {}
+_prefix_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(lang):
+    """
+    Returns the search index of the given language,
+    creating it if needed.
+    """
+    index = _indexes.get(lang)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(lang, SearchIndex())
+    return index
+
+
+def set_search_index(lang, index):
+    """
+    Replaces the search index of the given language.
+    """
+    with _indexes_lock:
+        _indexes[lang] = index
+
+
+# Start time of the last search index build of each language, and
+# the languages being built.
+_builds = {}
+_building = set()
+
+
+def claim_build(lang, retry_after=60):
+    """
+    True if the caller may build the search index of the language:
+    no build of it is running nor started less than retry_after
+    seconds ago. release_build must be called once done.
+    """
+    now = time.time()
+    with _indexes_lock:
+        if lang in _building or now - _builds.get(lang, 0) < retry_after:
+            return False
+        _building.add(lang)
+        _builds[lang] = now
+    return True
+
+
+def release_build(lang):
+    with _indexes_lock:
+        _building.discard(lang)
+
+
+def get_prefix_index(lang):
+    """
+    Returns the autocomplete index of the given language,
+    creating it if needed.
+    """
+    index = _prefix_indexes.get(lang)
+    if index is None:
+        with _indexes_lock:
+            index = _prefix_indexes.setdefault(lang, PrefixIndex(getattr(
+                settings, 'WP_API_AUTOCOMPLETE_MAX_POSTS', 500)))
+    return index
+
+
+def clear_search_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+        _prefix_indexes.clear()
+        _builds.clear()
+        _building.clear()
@@ -0,0 +1,307 @@
+import errno
+import json
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+import six
+from django.conf import settings
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# A snapshot file is a header, then for the authors, the tags and the
+# categories a table of records, a table of slugs sorted by slug and
+# a table of ids sorted by id, followed by the JSON of every term.
+MAGIC = b'WPTAX001'
+HEADER = struct.Struct('<8sdI')
+SECTION = struct.Struct('<QQQI')
+RECORD = struct.Struct('<QI')
+SLUG = struct.Struct('<QII')
+ID = struct.Struct('<qI')
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def snapshot_path(site, lang):
+    """
+    Returns the snapshot file of the taxonomies of a site and
+    language in WP_API_SHARED_TAXONOMIES, None if it is not set.
+    """
+    directory = getattr(settings, 'WP_API_SHARED_TAXONOMIES', None)
+    if not directory:
+        return None
+    return os.path.join(
+        directory, '{}-{}.taxonomies'.format(site.name, lang))
+
+
+class _Section(object):
+    """
+    Read-only view of the terms of a section of a mapped snapshot.
+    Only the terms looked up are decoded.
+    """
+
+    def __init__(self, data, records_at, slugs_at, ids_at, count):
+        self._data = data
+        self._records_at = records_at
+        self._slugs_at = slugs_at
+        self._ids_at = ids_at
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, index):
+        offset, length = RECORD.unpack_from(
+            self._data, self._records_at + index * RECORD.size)
+        return json.loads(self._data[offset:offset + length].decode('utf-8'))
+
+    def _slug(self, position):
+        offset, length, index = SLUG.unpack_from(
+            self._data, self._slugs_at + position * SLUG.size)
+        return self._data[offset:offset + length], index
+
+    def _id(self, position):
+        return ID.unpack_from(self._data, self._ids_at + position * ID.size)
+
+    def _search(self, entry, value):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if entry(middle)[0] < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            found, index = entry(low)
+            if found == value:
+                return index
+        return None
+
+    def _slug_index(self, slug):
+        if not isinstance(slug, six.string_types):
+            return None
+        return self._search(self._slug, slug.encode('utf-8'))
+
+    def _id_index(self, term_id):
+        if not isinstance(term_id, six.integer_types):
+            return None
+        return self._search(self._id, term_id)
+
+    def by_slug(self, slug):
+        """
+        Returns the term of the given slug, None if there is none.
+        """
+        index = self._slug_index(slug)
+        return None if index is None else self._record(index)
+
+    def by_id(self, term_id):
+        """
+        Returns the term of the given id, None if there is none.
+        """
+        index = self._id_index(term_id)
+        return None if index is None else self._record(index)
+
+    def with_ids(self, term_ids):
+        """
+        Returns the terms whose id is in term_ids, in the order of
+        the snapshot.
+        """
+        indexes = set(self._id_index(term_id) for term_id in term_ids)
+        indexes.discard(None)
+        return [self._record(index) for index in sorted(indexes)]
+
+
+class TermTable(_Section):
+    """
+    The tags or categories of a snapshot, read as a list.
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._record(index)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._record(index)
+
+    def __contains__(self, term):
+        return isinstance(term, dict) and\
+            self.by_id(term.get('id')) == term
+
+    def __reduce__(self):
+        # Cached contexts store a plain list, not the mapped file.
+        return (list, (list(self),))
+
+
+class AuthorTable(_Section):
+    """
+    The authors of a snapshot, read as a dict of slug: author.
+    """
+
+    def __getitem__(self, slug):
+        author = self.by_slug(slug)
+        if author is None:
+            raise KeyError(slug)
+        return author
+
+    def __contains__(self, slug):
+        return self._slug_index(slug) is not None
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self._slug(position)[0].decode('utf-8')
+
+    def get(self, slug, default=None):
+        author = self.by_slug(slug)
+        return default if author is None else author
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self._record(index) for index in range(self._count)]
+
+    def items(self):
+        return [(author['slug'], author) for author in self.values()]
+
+    def __reduce__(self):
+        return (dict, (self.items(),))
+
+
+def _encode_section(out, terms):
+    """
+    Appends the tables and terms of a section to out and returns
+    the offsets of its tables.
+    """
+    count = len(terms)
+    records = [
+        json.dumps(term, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        for term in terms]
+    slugs = [six.text_type(term.get('slug', '')).encode('utf-8')
+             for term in terms]
+    records_at = len(out)
+    slugs_at = records_at + count * RECORD.size
+    ids_at = slugs_at + count * SLUG.size
+    out.extend(b'\0' * (ids_at + count * ID.size - records_at))
+    for index, record in enumerate(records):
+        RECORD.pack_into(
+            out, records_at + index * RECORD.size, len(out), len(record))
+        out.extend(record)
+    by_slug = sorted(range(count), key=lambda index: slugs[index])
+    for position, index in enumerate(by_slug):
+        SLUG.pack_into(
+            out, slugs_at + position * SLUG.size,
+            len(out), len(slugs[index]), index)
+        out.extend(slugs[index])
+    by_id = sorted(range(count), key=lambda index: terms[index]['id'])
+    for position, index in enumerate(by_id):
+        ID.pack_into(
+            out, ids_at + position * ID.size, terms[index]['id'], index)
+    return records_at, slugs_at, ids_at, count
+
+
+def encode(authors, tags, categories, loaded_at):
+    """
+    Returns the snapshot file contents of the given taxonomies.
+    """
+    sections = (list(authors.values()), list(tags), list(categories))
+    out = bytearray(HEADER.size + len(sections) * SECTION.size)
+    HEADER.pack_into(out, 0, MAGIC, loaded_at, len(sections))
+    for number, terms in enumerate(sections):
+        SECTION.pack_into(
+            out, HEADER.size + number * SECTION.size,
+            *_encode_section(out, terms))
+    return bytes(out)
+
+
+def read(path):
+    """
+    Maps the snapshot file at path and returns its authors, tags,
+    categories and load time, None if there is no valid snapshot.
+    The mapping is shared with every process reading the file and
+    is kept while the snapshot is in use, even once a newer file
+    replaces it.
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            data = mmap.mmap(
+                snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    if len(data) < HEADER.size + 3 * SECTION.size:
+        return None
+    magic, loaded_at, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or count != 3:
+        return None
+    sections = [
+        SECTION.unpack_from(data, HEADER.size + number * SECTION.size)
+        for number in range(count)]
+    return (AuthorTable(data, *sections[0]), TermTable(data, *sections[1]),
+            TermTable(data, *sections[2]), loaded_at)
+
+
+def write_file(path, data):
+    """
+    Writes data to path, creating its directory. The file is
+    replaced at once, so readers see the old or the new contents,
+    never a partial file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    descriptor, temporary = tempfile.mkstemp(
+        dir=directory or os.curdir, prefix='.' + os.path.basename(path) + '-')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(data)
+        _replace(temporary, path)
+    except Exception:
+        os.remove(temporary)
+        raise
+
+
+def publish(path, authors, tags, categories, loaded_at):
+    """
+    Writes a snapshot of the taxonomies to path.
+    """
+    write_file(path, encode(authors, tags, categories, loaded_at))
+
+
+@contextmanager
+def build_lock(path):
+    """
+    Yields True if this process may build the snapshot at path,
+    False while another process of the host is building it.
+    """
+    if fcntl is None:  # pragma: no cover
+        yield True
+        return
+    try:
+        lock = open(path + '.lock', 'a')
+    except (IOError, OSError):
+        yield True
+        return
+    try:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    finally:
+        lock.close()
@@ -0,0 +1,139 @@
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.urls import reverse
+from .origins import build_origin_pool, get_origin_pool
+from .transports import build_transport
+
+DEFAULT_SITE = 'default'
+
+
+class Site(object):
+    """
+    A wordpress blog served by the project, with its own urls,
+    connections, cache namespace and timeouts. posts_per_page,
+    cache_timeout and cache_ttls are None to use the project wide
+    settings.
+    """
+
+    def __init__(self, name, urls, posts_per_page=None, cache_timeout=None,
+                 cache_prefix='', transport=None, origins=None,
+                 cache_ttls=None):
+        self.name = name
+        self.urls = list(urls)
+        self.url = self.urls[0] if self.urls else None
+        self.posts_per_page = posts_per_page
+        self.cache_timeout = cache_timeout
+        self.cache_ttls = cache_ttls
+        self.cache_prefix = cache_prefix
+        self.transport = transport
+        self.origins = origins
+
+    def cache_key(self, key):
+        """
+        Returns the key in the cache namespace of the site.
+        """
+        return self.cache_prefix + key
+
+    def namespace(self, lang):
+        """
+        Returns the name of the in-memory indexes of a language.
+        """
+        if not self.cache_prefix:
+            return lang
+        return self.cache_prefix + str(lang)
+
+
+def default_site():
+    """
+    The site of WP_URL or WP_URLS. Its cache keys have no prefix,
+    so they are the same as before sites were added.
+    """
+    urls = getattr(settings, 'WP_URLS', None) or\
+        [getattr(settings, 'WP_URL', None)]
+    return Site(DEFAULT_SITE, urls, origins=get_origin_pool())
+
+
+def configured_site(name, options):
+    """
+    Returns a site of WP_API_SITES. The options are URL or URLS,
+    POSTS_PER_PAGE, CACHE_TIMEOUT, CACHE_TTLS, CACHE_PREFIX,
+    '<name>:' by default, and TRANSPORT, a dotted path to a
+    transport class.
+    """
+    urls = options.get('URLS') or [options.get('URL')]
+    if not urls[0]:
+        raise ImproperlyConfigured(
+            "Missing wordpress url of the site {}".format(name))
+    return Site(
+        name, urls,
+        posts_per_page=options.get('POSTS_PER_PAGE'),
+        cache_timeout=options.get('CACHE_TIMEOUT'),
+        cache_ttls=options.get('CACHE_TTLS'),
+        cache_prefix=options.get('CACHE_PREFIX', name + ':'),
+        transport=build_transport(options.get('TRANSPORT')),
+        origins=build_origin_pool(urls) if len(urls) > 1 else None)
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+
+
+def get_site(name=None):
+    """
+    Returns the site of the given name, the default site if name is
+    None. Sites are created once per process, so each keeps its
+    connections to wordpress.
+    """
+    name = name or DEFAULT_SITE
+    site = _sites.get(name)
+    if site is None:
+        if name == DEFAULT_SITE:
+            site = default_site()
+        else:
+            sites = getattr(settings, 'WP_API_SITES', {})
+            if name not in sites:
+                raise ImproperlyConfigured(
+                    "Unknown wordpress site {}".format(name))
+            site = configured_site(name, sites[name])
+        with _sites_lock:
+            site = _sites.setdefault(name, site)
+    return site
+
+
+def site_for_request(request, name=None):
+    """
+    Returns the site of the given name, else the site of the request
+    host in WP_API_SITE_HOSTS, else the default site.
+    """
+    hosts = getattr(settings, 'WP_API_SITE_HOSTS', None)
+    if name is None and hosts:
+        name = hosts.get(request.get_host().split(':')[0])
+    return get_site(name)
+
+
+def site_reverse(request, name, args=None):
+    """
+    Reverses a url name of the app in the namespace the request was
+    resolved in, so the urls of a site included with a namespace
+    link to that site.
+    """
+    match = getattr(request, 'resolver_match', None)
+    namespace = match.namespace if match is not None else None
+    if namespace:
+        name = '{}:{}'.format(namespace, name)
+    return reverse(name, args=args, current_app=namespace)
+
+
+def reset_sites(**kwargs):
+    setting = kwargs.get('setting')
+    if setting is None or setting in ('WP_URL', 'WP_URLS', 'WP_API_SITES') or\
+       setting.startswith(('WP_API_ORIGIN_', 'WP_API_HEDGE_')) or\
+       setting in ('WP_API_TRANSPORT', 'WP_API_REPLAY_CASSETTE',
+                   'WP_API_RECORD_CASSETTE', 'WP_API_FAULT_INJECTION'):
+        with _sites_lock:
+            _sites.clear()
+
+
+setting_changed.connect(reset_sites)
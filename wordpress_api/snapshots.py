@@ -0,0 +1,127 @@
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import zlib
+from django.conf import settings
+from django.core.cache import cache
+from .caching import SENTINEL_KEY, registry_key, registry_keys
+from .shm import write_file
+
+logger = logging.getLogger('wordpress_api.snapshots')
+
+
+def snapshot_path():
+    return getattr(settings, 'WP_API_CACHE_SNAPSHOT', None)
+
+
+def dump_cache(path):
+    """
+    Writes the registered cache entries that have not expired to
+    the snapshot file at path. Returns the number of entries.
+    """
+    now = time.time()
+    registry = {}
+    for shard in cache.get_many(registry_keys()).values():
+        registry.update((key, expires) for key, expires in shard.items()
+                        if expires is None or expires > now)
+    values = cache.get_many(list(registry))
+    entries = [(key, value, registry[key])
+               for key, value in values.items()]
+    write_file(path, zlib.compress(
+        pickle.dumps(entries, pickle.HIGHEST_PROTOCOL)))
+    return len(entries)
+
+
+def load_cache(path):
+    """
+    Restores the entries of the snapshot file at path that have not
+    expired, for the rest of their timeout. Values already in the
+    cache are kept. Returns the number of entries restored.
+    """
+    with open(path, 'rb') as snapshot:
+        entries = pickle.loads(zlib.decompress(snapshot.read()))
+    now = time.time()
+    added = {}
+    for key, value, expires in entries:
+        if expires is not None and expires <= now:
+            continue
+        if cache.add(key, value, None if expires is None else expires - now):
+            added.setdefault(registry_key(key), {})[key] = expires
+    registries = cache.get_many(list(added))
+    for shard, keys in added.items():
+        registries.setdefault(shard, {}).update(keys)
+    cache.set_many(registries, None)
+    return sum(len(keys) for keys in added.values())
+
+
+def restore_on_startup():
+    """
+    Restores the snapshot file when the registry sentinel is missing
+    from the cache, as after a restart of the cache servers. Only the
+    process that adds the sentinel again restores it.
+    """
+    path = snapshot_path()
+    if not path or not cache.add(SENTINEL_KEY, True, None) or\
+       not os.path.exists(path):
+        return 0
+    try:
+        restored = load_cache(path)
+    except Exception:
+        logger.exception('Restore of the cache snapshot %s failed', path)
+        return 0
+    logger.info('Restored %s cache entries from %s', restored, path)
+    return restored
+
+
+class Snapshotter(threading.Thread):
+    """
+    Daemon thread writing the cache snapshot every interval
+    seconds, until stop is called. Only one process of the host
+    writes it per interval. When the cache lost its registry since
+    the last snapshot, the snapshot is restored instead of being
+    overwritten with the nearly empty cache.
+    """
+
+    def __init__(self, path, interval):
+        super(Snapshotter, self).__init__(name='wordpress_api-snapshots')
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lock_key = 'wp_api_cache_snapshot_{}'.format(
+            socket.gethostname())
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if cache.get(SENTINEL_KEY) is None:
+                restore_on_startup()
+                continue
+            if not cache.add(self.lock_key, 1, self.interval):
+                continue
+            try:
+                dump_cache(self.path)
+            except Exception:
+                logger.exception(
+                    'Cache snapshot to %s failed', self.path)
+
+    def stop(self):
+        self.stopped.set()
+
+
+_snapshotter = None
+
+
+def start_snapshots():
+    """
+    Starts the snapshot thread of the process, once, unless
+    WP_API_CACHE_SNAPSHOT_INTERVAL is 0.
+    """
+    global _snapshotter
+    interval = getattr(settings, 'WP_API_CACHE_SNAPSHOT_INTERVAL', 300)
+    if _snapshotter is None and interval:
+        _snapshotter = Snapshotter(snapshot_path(), interval)
+        _snapshotter.start()
+    return _snapshotter
@@ -1,11 +1,54 @@
 # !/usr/bin/env python
 #  -*- coding: utf-8 -*-
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
 import responses
-from django.urls import reverse
+from requests.exceptions import Timeout
+from six import StringIO
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+from django.conf.urls import include, url
+from django.urls import resolve, reverse
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
-from django.test import TestCase, override_settings, Client
-from wordpress_api.utils import WPApiConnector
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.test import TestCase, override_settings, Client, RequestFactory
+from wordpress_api.utils import (
+    WPApiConnector, clear_connectors, get_connector)
+from wordpress_api.feed_views import LatestEntriesFeed, trim_excerpt
+from wordpress_api.bloom import (
+    BloomFilter, clear_known_slugs, is_known_slug, refresh_known_slugs)
+from wordpress_api.bulkhead import Bulkhead, BulkheadFull, get_bulkhead
+from wordpress_api.caching import (
+    CachedValue, LRUCache, cache_add, cache_get, cache_timeout, registry_key)
+from wordpress_api.deadline import (
+    DeadlineExceeded, get_timeout, remaining, request_deadline)
+from wordpress_api.middleware import analyze_calls
+from wordpress_api.origins import OriginPool
+from wordpress_api.prefetch import Prefetcher, prefetch_taxonomies
+from wordpress_api.metrics import NullExporter, get_exporter
+from wordpress_api.transports import (
+    FaultInjectingTransport, RecordingTransport, ReplayTransport,
+    RequestsTransport)
+from wordpress_api.sites import get_site
+from wordpress_api.shm import TermTable, publish, read
+from wordpress_api.snapshots import Snapshotter, load_cache, restore_on_startup
+from wordpress_api.search import (
+    PrefixIndex, SearchIndex, clear_search_indexes, get_prefix_index,
+    get_search_index, search_cache_key)
+from wordpress_api.related import (
+    RelatedPostsIndex, clear_related_indexes, get_related_index)
+from wordpress_api.retry import RetryBudget, RetryPolicy
+from wordpress_api import caching, profiling, urls, views
 
 
 """
@@ -16,6 +59,18 @@ Tests for `django-wordpress-api` models module.
 """
 
 
+class NamespacedUrls(object):
+    """
+    URLconf with the app included under the news namespace.
+    """
+    urlpatterns = [
+        url(r'^news/', include(([
+            url(r'^feed/$', LatestEntriesFeed(), name='wordpress_api_feed'),
+        ] + urls.urlpatterns, 'wordpress_api'), namespace='news')),
+        url(r'^', include(urls.urlpatterns)),
+    ]
+
+
 class TestUtils(TestCase):
     """
     Tests for wordpress_api.utils
@@ -2063,3 +2118,1588 @@ class TestViews(TestCase):
             reverse('wordpress_api_blog_by_author_list',
                     args=('test-slug',)))
         self.assertEqual(response.status_code, 404)
+
+
+class TestSearchIndex(TestCase):
+    """
+    Tests for wordpress_api.search
+    """
+
+    def setUp(self):
+        clear_search_indexes()
+        self.posts = [
+            {'id': 1, 'slug': 'django-tips', 'date': '2017-01-01T00:00:00',
+             'title': {'rendered': 'Django tips'},
+             'excerpt': {'rendered': '<p>Some tips</p>'},
+             'content': {'rendered': '<p>Use django and python</p>'}},
+            {'id': 2, 'slug': 'python-news', 'date': '2018-01-01T00:00:00',
+             'title': {'rendered': 'Python news'},
+             'excerpt': {'rendered': '<p>News about python</p>'},
+             'content': {'rendered': '<p>Nothing about the framework</p>'}},
+        ]
+
+    def tearDown(self):
+        clear_search_indexes()
+
+    def test_search_ranks_and_requires_every_term(self):
+        """
+        Posts must contain all the query terms and the ones with
+        the term in the title are ranked first.
+        """
+        index = SearchIndex()
+        index.add_posts(self.posts)
+        results = index.search('Python')
+        self.assertEqual(
+            ['python-news', 'django-tips'],
+            [post['slug'] for post in results])
+        results = index.search('django  PYTHON')
+        self.assertEqual(['django-tips'], [post['slug'] for post in results])
+        self.assertEqual([], index.search('<p>'))
+
+    def test_search_page_matches_get_posts_output(self):
+        """
+        Local results are paginated with the wordpress headers.
+        """
+        index = SearchIndex()
+        index.add_posts(self.posts)
+        page = index.search_page('python', page_number=2, per_page=1)
+        self.assertEqual('2', page['headers']['X-WP-Total'])
+        self.assertEqual('2', page['headers']['X-WP-TotalPages'])
+        self.assertEqual('django-tips', page['body'][0]['slug'])
+
+    @override_settings(WP_API_LOCAL_SEARCH=True)
+    @responses.activate
+    def test_connector_serves_search_locally(self):
+        """
+        Once every post was indexed, searches do not reach wordpress.
+        """
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=self.posts, status=200,
+                      adding_headers={'X-WP-Total': '2',
+                                      'X-WP-TotalPages': '1'})
+        connector = WPApiConnector(load_meta_data=False)
+        self.assertEqual(2, connector.build_search_index())
+        posts = connector.get_posts(search='framework')
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual('python-news', posts['body'][0]['slug'])
+
+    @override_settings(WP_API_LOCAL_SEARCH=True, WP_API_AUTOCOMPLETE=True,
+                       WP_API_LOCAL_RELATED_POSTS=True)
+    @responses.activate
+    def test_sweeps_fetch_full_pages_outside_get_posts(self):
+        self.addCleanup(clear_related_indexes)
+        clear_related_indexes()
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=self.posts, status=200,
+                      adding_headers={'X-WP-TotalPages': '1'})
+        connector = WPApiConnector(load_meta_data=False)
+        self.assertEqual(2, connector.build_search_index())
+        self.assertIn('per_page=100', responses.calls[0].request.url)
+        self.assertEqual([], get_prefix_index('en').suggest('django'))
+        self.assertEqual(2, len(get_related_index('en')))
+
+    @override_settings(WP_API_LOCAL_SEARCH=True)
+    @responses.activate
+    def test_partial_indexes_are_not_searched(self):
+        """
+        Posts fetched by the pages seen so far are not the whole
+        blog, wordpress answers until a sweep succeeded.
+        """
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=self.posts[:1], status=200,
+                      adding_headers={'X-WP-Total': '2',
+                                      'X-WP-TotalPages': '2'})
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json={'code': 'error'}, status=500)
+        connector = WPApiConnector(load_meta_data=False)
+        connector.get_posts()
+        with mock.patch.object(
+                WPApiConnector, 'refresh_search_index') as refresh:
+            connector.get_posts(search='framework')
+        refresh.assert_called_once_with()
+        self.assertIn('search=framework', responses.calls[1].request.url)
+        self.assertIsNone(connector.build_search_index())
+        self.assertFalse(get_search_index('en').is_fresh(None))
+
+    @override_settings(WP_API_LOCAL_SEARCH=True)
+    @responses.activate
+    def test_rebuilt_indexes_forget_deleted_posts(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=self.posts, status=200,
+                      adding_headers={'X-WP-TotalPages': '1'})
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=self.posts[:1], status=200,
+                      adding_headers={'X-WP-TotalPages': '1'})
+        connector = WPApiConnector(load_meta_data=False)
+        connector.build_search_index()
+        connector.build_search_index()
+        self.assertEqual([], connector.get_posts(search='news')['body'])
+        with mock.patch('wordpress_api.search.time.time',
+                        return_value=time.time() + 7200), \
+                mock.patch.object(
+                    WPApiConnector, 'refresh_search_index') as refresh:
+            self.assertFalse(get_search_index('en').is_fresh(3600))
+            connector.get_posts(search='news')
+        refresh.assert_called_once_with()
+
+
+class TestSearchCache(TestCase):
+    """
+    Tests for the search result cache of BlogListView
+    """
+
+    def setUp(self):
+        views.search_cache.clear()
+
+    def tearDown(self):
+        views.search_cache.clear()
+
+    def add_responses(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'excerpt': 'test',
+                   'date': '2007-01-25T12:00:00Z'}],
+            status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '1'})
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(1, lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        lru.set('d', 4, 0)
+        self.assertIsNone(lru.get('d'))
+
+    def test_search_cache_key_is_normalized(self):
+        self.assertEqual(
+            search_cache_key('Django  Tips', 1, 'en'),
+            search_cache_key(' django tips ', 1, 'en'))
+        self.assertNotEqual(
+            search_cache_key('django', 1, 'en'),
+            search_cache_key('django', 2, 'en'))
+
+    @mock.patch.object(views, 'cache_time', 60)
+    @responses.activate
+    def test_repeated_searches_are_cached(self):
+        """
+        Equivalent searches are served from the cache and do not
+        share the entry of the unfiltered list.
+        """
+        self.add_responses()
+        url = reverse('wordpress_api_blog_list')
+        self.assertEqual(
+            200, self.client.get(url, {'q': 'Test  Blog'}).status_code)
+        posts_calls = [call for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(1, len(posts_calls))
+        self.assertEqual(
+            200, self.client.get(url, {'q': 'test blog'}).status_code)
+        posts_calls = [call for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(1, len(posts_calls))
+        self.assertIn('search=Test', posts_calls[0].request.url)
+
+
+class TestAutocomplete(TestCase):
+    """
+    Tests for the autocomplete prefix index and view
+    """
+
+    def setUp(self):
+        clear_search_indexes()
+
+    def tearDown(self):
+        clear_search_indexes()
+
+    def test_prefix_index_matches_word_prefixes(self):
+        index = PrefixIndex(max_posts=1)
+        index.update_terms('tag', [{'slug': 'django', 'name': 'Django'}])
+        index.add_posts([
+            {'slug': 'old', 'title': {'rendered': 'Django old'}},
+            {'slug': 'tips', 'title': {'rendered': 'Django <b>tips</b>'}},
+        ])
+        self.assertEqual(
+            ['django', 'tips'],
+            [suggestion['slug'] for suggestion in index.suggest('DJ')])
+        self.assertEqual(
+            [{'type': 'post', 'slug': 'tips', 'label': 'Django tips'}],
+            index.suggest('tip'))
+        self.assertEqual([], index.suggest(' '))
+
+    def test_prefix_index_is_updated_in_place(self):
+        index = PrefixIndex(max_posts=2)
+        index.update_terms('tag', [{'slug': 'django', 'name': 'Django'}])
+        post = {'slug': 'tips', 'title': {'rendered': 'Django tips'}}
+        index.add_posts([post])
+        entries = list(index._entries)
+        index.add_posts([post])
+        self.assertEqual(entries, index._entries)
+        index.add_posts([
+            {'slug': 'tips', 'title': {'rendered': 'Flask tips'}},
+            {'slug': 'news', 'title': {'rendered': 'Django news'}},
+            {'slug': 'more', 'title': {'rendered': 'More django'}},
+        ])
+        # 'tips' was evicted by the newer posts.
+        self.assertEqual(
+            ['more', 'django', 'news'],
+            [suggestion['slug'] for suggestion in index.suggest('dj')])
+        self.assertEqual([], index.suggest('flask'))
+        self.assertEqual(sorted(index._entries), index._entries)
+
+    def test_prefix_index_keeps_the_newest_posts(self):
+        index = PrefixIndex(max_posts=5)
+        posts = [{'slug': 'post-{}'.format(number),
+                  'date': '2020-01-{:02d}T00:00:00'.format(number),
+                  'title': {'rendered': 'Post {}'.format(number)}}
+                 for number in range(30, 0, -1)]
+        # Wordpress returns the newest posts first.
+        for start in range(0, 30, 10):
+            index.add_posts(posts[start:start + 10])
+        self.assertEqual(
+            ['post-26', 'post-27', 'post-28', 'post-29', 'post-30'],
+            sorted(index.posts))
+
+    @override_settings(WP_API_AUTOCOMPLETE=True)
+    @responses.activate
+    def test_terms_cached_by_other_workers_are_indexed(self):
+        self.addCleanup(cache.clear)
+        cache.set('blog_cache_tags_en', [{'id': 1, 'slug': 'old'}])
+        for endpoint in ('users', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[], status=200)
+        connector = WPApiConnector()
+        self.assertEqual('old', get_prefix_index('en').suggest('ol')[0]['slug'])
+        cache.set('blog_cache_tags_en', [{'id': 2, 'slug': 'new'}])
+        connector.refresh_taxonomies(0)
+        self.assertEqual('new', connector.tags[0]['slug'])
+        self.assertEqual('new', get_prefix_index('en').suggest('ne')[0]['slug'])
+        self.assertEqual([], get_prefix_index('en').suggest('ol'))
+
+    @override_settings(WP_API_AUTOCOMPLETE=True)
+    @responses.activate
+    def test_autocomplete_view_does_not_query_wordpress(self):
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/categories/',
+            json=[{'id': 1, 'slug': 'news', 'name': 'News'}], status=200)
+        WPApiConnector(load_meta_data=False).get_categories()
+        calls = len(responses.calls)
+        response = self.client.get(
+            reverse('wordpress_api_autocomplete'), {'q': 'ne'})
+        self.assertEqual(calls, len(responses.calls))
+        self.assertEqual(
+            reverse('wordpress_api_blog_category_list', args=['news']),
+            response.json()['suggestions'][0]['url'])
+
+    @override_settings(
+        WP_API_AUTOCOMPLETE=True, ROOT_URLCONF=NamespacedUrls)
+    @responses.activate
+    def test_autocomplete_links_within_its_namespace(self):
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/categories/',
+            json=[{'id': 1, 'slug': 'news', 'name': 'News'}], status=200)
+        WPApiConnector(load_meta_data=False).get_categories()
+        response = self.client.get('/news/autocomplete/', {'q': 'ne'})
+        self.assertEqual(
+            '/news/category/news/',
+            response.json()['suggestions'][0]['url'])
+
+
+class TestRelatedPosts(TestCase):
+    """
+    Tests for wordpress_api.related
+    """
+
+    def setUp(self):
+        clear_related_indexes()
+
+    def tearDown(self):
+        clear_related_indexes()
+
+    def test_related_scores_shared_terms_and_recency(self):
+        index = RelatedPostsIndex(half_life_days=30)
+        index.add_posts([
+            {'id': 1, 'tags': [1, 2], 'categories': [1],
+             'date_gmt': '2018-01-01T00:00:00'},
+            {'id': 2, 'tags': [1, 2], 'categories': [],
+             'date_gmt': '2018-01-01T00:00:00'},
+            {'id': 3, 'tags': [1], 'categories': [],
+             'date_gmt': '2018-01-01T00:00:00'},
+            {'id': 4, 'tags': [1], 'categories': [],
+             'date_gmt': '2010-01-01T00:00:00'},
+            {'id': 5, 'tags': [3], 'categories': [],
+             'date_gmt': '2018-01-01T00:00:00'},
+        ])
+        related = index.related(
+            {'id': 1, 'tags': [1, 2], 'categories': [1]}, limit=5)
+        self.assertEqual([2, 3, 4], [post['id'] for post in related])
+
+    def test_posts_are_updated_incrementally(self):
+        index = RelatedPostsIndex()
+        index.add_post({'id': 1, 'tags': [1]})
+        index.add_post({'id': 2, 'tags': [1]})
+        index.add_post({'id': 2, 'tags': [2]})
+        self.assertEqual([], index.related({'id': 1, 'tags': [1]}))
+        self.assertEqual(2, len(index))
+
+    def test_only_the_most_recent_rendered_posts_are_kept(self):
+        index = RelatedPostsIndex(max_posts=2)
+        for post_id in range(1, 4):
+            index.add_post({
+                'id': post_id, 'slug': 'post-{}'.format(post_id),
+                'tags': [1], 'content': {'rendered': 'long'},
+                'date_gmt': '2018-01-0{}T00:00:00'.format(post_id),
+                '_embedded': {'wp:featuredmedia': [{'id': 1}],
+                              'wp:term': [[{'id': 1}]]}})
+        self.assertEqual(2, len(index))
+        related = index.related({'id': 4, 'tags': [1]})
+        self.assertEqual([3, 2], [post['id'] for post in related])
+        self.assertNotIn('content', related[0])
+        self.assertEqual({'wp:featuredmedia': [{'id': 1}]},
+                         related[0]['_embedded'])
+
+    def test_sweeps_drop_deleted_posts(self):
+        index = RelatedPostsIndex()
+        index.add_posts([{'id': 1, 'tags': [1]}, {'id': 2, 'tags': [1]}])
+        index.replace_posts([{'id': 2, 'tags': [1]}, {'id': 3, 'tags': [1]}])
+        self.assertEqual(
+            [3], [post['id'] for post in index.related({'id': 2, 'tags': [1]})])
+        self.assertEqual(2, len(index))
+
+    @override_settings(WP_API_LOCAL_RELATED_POSTS=True)
+    @responses.activate
+    def test_search_index_sweeps_replace_the_related_posts(self):
+        get_related_index('en').add_post({'id': 9, 'tags': [1]})
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'tags': [1],
+                   'title': {'rendered': 'Test'},
+                   'date_gmt': '2007-01-25T12:00:00Z'}],
+            status=200, adding_headers={'X-WP-TotalPages': '1'})
+        WPApiConnector(load_meta_data=False).build_search_index()
+        related = get_related_index('en').related({'id': 2, 'tags': [1]})
+        self.assertEqual([1], [post['id'] for post in related])
+
+    @override_settings(WP_API_LOCAL_RELATED_POSTS=True)
+    @responses.activate
+    def test_blog_view_uses_local_related_posts(self):
+        """
+        The detail page does not ask wordpress for related posts.
+        """
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': post_id, 'slug': 'test-blog-{}'.format(post_id),
+                   'tags': [1], 'categories': [1],
+                   'date': '2007-01-25T12:00:00Z',
+                   'date_gmt': '2007-01-25T12:00:00Z'}
+                  for post_id in range(1, 5)],
+            status=200)
+        WPApiConnector(load_meta_data=False).get_posts()
+        self.addCleanup(cache.clear)
+        with mock.patch.object(views, 'cache_time', 60):
+            response = self.client.get(
+                reverse('wordpress_api_blog_detail', args=['test-blog-1']))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(response.context['related_blogs']))
+        posts_calls = [call for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(2, len(posts_calls))
+        self.assertNotIn('tag=', posts_calls[-1].request.url)
+        self.assertIsNone(
+            cache.get('blog_cache_detail_related_test-blog-1_en'))
+
+    @override_settings(WP_API_LOCAL_RELATED_POSTS=True)
+    @responses.activate
+    def test_cold_index_asks_wordpress(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'tags': [1],
+                   'categories': [1], 'date': '2007-01-25T12:00:00Z',
+                   'date_gmt': '2007-01-25T12:00:00Z'}],
+            status=200)
+        response = self.client.get(
+            reverse('wordpress_api_blog_detail', args=['test-blog']))
+        self.assertEqual(200, response.status_code)
+        self.assertIn('tag=1', responses.calls[-1].request.url)
+
+
+class TestKnownSlugs(TestCase):
+    """
+    Tests for wordpress_api.bloom
+    """
+
+    def setUp(self):
+        clear_known_slugs()
+
+    def tearDown(self):
+        clear_known_slugs()
+
+    def join_sweeps(self):
+        for thread in threading.enumerate():
+            if thread.name == 'wordpress_api-slugs':
+                thread.join(5)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        slugs = ['post-{}'.format(i) for i in range(1000)]
+        for slug in slugs:
+            bloom.add(slug)
+        self.assertTrue(all(slug in bloom for slug in slugs))
+        false_positives = sum(
+            'missing-{}'.format(i) in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    @override_settings(WP_API_SLUG_FILTER=True,
+                       WP_API_SLUG_FILTER_PROBE_INTERVAL=60)
+    @responses.activate
+    def test_unknown_slugs_are_rejected_locally(self):
+        """
+        Only the slug sweep and a single probe reach wordpress
+        for unknown slugs.
+        """
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[], status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'slug': 'test-blog'}], status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '1'})
+        self.addCleanup(clear_connectors)
+        refresh_known_slugs(get_connector('en'), background=False)
+        for slug in ('probe-1', 'probe-2', 'probe-3'):
+            response = self.client.get(
+                reverse('wordpress_api_blog_detail', args=[slug]))
+            self.assertEqual(404, response.status_code)
+        posts_calls = [call.request.url for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(2, len(posts_calls))
+        self.assertTrue(all('_fields=slug' in url for url in posts_calls))
+
+    @override_settings(WP_API_SLUG_FILTER=True)
+    @responses.activate
+    def test_failed_sweeps_back_off(self):
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json={'code': 'error'}, status=500)
+        connector = WPApiConnector(load_meta_data=False)
+        self.assertTrue(is_known_slug(connector, 'test-blog'))
+        self.join_sweeps()
+        self.assertTrue(is_known_slug(connector, 'test-blog'))
+        self.join_sweeps()
+        self.assertEqual(1, len(responses.calls))
+        with mock.patch('wordpress_api.bloom.time.time',
+                        return_value=time.time() + 61):
+            self.assertIsNone(
+                refresh_known_slugs(connector, background=False))
+        self.assertEqual(2, len(responses.calls))
+
+    @override_settings(WP_API_SLUG_FILTER=True)
+    @responses.activate
+    def test_requests_never_wait_for_the_sweep(self):
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'slug': 'test-blog'}], status=200,
+            adding_headers={'X-WP-TotalPages': '1'})
+        connector = WPApiConnector(load_meta_data=False)
+        sweeping = threading.Event()
+        release = threading.Event()
+
+        def build(connector):
+            sweeping.set()
+            release.wait(5)
+        with mock.patch('wordpress_api.bloom._build', side_effect=build):
+            # The slug is let through while the sweep runs.
+            self.assertTrue(is_known_slug(connector, 'missing'))
+            self.assertTrue(sweeping.wait(5))
+            self.assertTrue(is_known_slug(connector, 'missing'))
+            release.set()
+            self.join_sweeps()
+        # The mocked sweep failed, its back off is forgotten.
+        clear_known_slugs()
+        refresh_known_slugs(connector)
+        self.join_sweeps()
+        self.assertFalse(is_known_slug(connector, 'missing'))
+
+    @override_settings(WP_API_SLUG_FILTER=True,
+                       WP_API_PREFETCH_ON_STARTUP=True,
+                       WP_API_PREFETCH_LANGUAGES=['en'])
+    @responses.activate
+    def test_prefetch_sweeps_the_slugs(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[], status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'slug': 'test-blog'}], status=200,
+            adding_headers={'X-WP-TotalPages': '1'})
+        self.addCleanup(clear_connectors)
+        connector = WPApiConnector(load_meta_data=False)
+        # Requests never sweep, unknown slugs pass until the filter exists.
+        self.assertTrue(is_known_slug(connector, 'missing'))
+        self.assertEqual(0, len(responses.calls))
+        prefetch_taxonomies()
+        calls = len(responses.calls)
+        self.assertTrue(is_known_slug(connector, 'test-blog'))
+        self.assertEqual(calls, len(responses.calls))
+
+
+class TestMetrics(TestCase):
+    """
+    Tests for wordpress_api.metrics
+    """
+
+    def test_null_exporter_is_the_default(self):
+        self.assertIsInstance(get_exporter(), NullExporter)
+        request = RequestFactory().get('/metrics/')
+        with self.assertRaises(Http404):
+            views.MetricsView.as_view()(request)
+
+    @override_settings(
+        WP_API_METRICS_EXPORTER='wordpress_api.metrics.PrometheusExporter')
+    @responses.activate
+    def test_prometheus_exporter_records_requests_and_cache(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/tags/',
+                      json=[{'id': 1, 'slug': 'test'}], status=200,
+                      adding_headers={'X-WP-TotalPages': '1'})
+        WPApiConnector(load_meta_data=False).get_tags()
+        cache_get('missing-key', 'blog_list')
+        response = views.MetricsView.as_view()(
+            RequestFactory().get('/metrics/'))
+        content = response.content.decode('utf-8')
+        self.assertIn(
+            'wordpress_api_upstream_request_seconds_count'
+            '{endpoint="tags",status="200"} 1', content)
+        self.assertIn(
+            'wordpress_api_upstream_pages_count{endpoint="tags"} 1', content)
+        self.assertIn(
+            'wordpress_api_cache_requests_total'
+            '{family="blog_list",result="miss"} 1', content)
+
+
+class TestServerTiming(TestCase):
+    """
+    Tests for wordpress_api.middleware.ServerTimingMiddleware
+    """
+
+    @override_settings(MIDDLEWARE=settings.MIDDLEWARE + (
+        'wordpress_api.middleware.ServerTimingMiddleware',))
+    @responses.activate
+    def test_server_timing_header_breaks_down_phases(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[], status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'excerpt': 'test',
+                   'date': '2007-01-25T12:00:00Z'}],
+            status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '1'})
+        with self.assertLogs('wordpress_api.timing', 'INFO') as logs:
+            response = self.client.get(reverse('wordpress_api_blog_list'))
+        header = response['Server-Timing']
+        for name in ('cache', 'upstream', 'postprocess', 'render', 'total'):
+            self.assertIn(name + ';dur=', header)
+        self.assertIn('"status": 200', logs.output[0])
+
+    @override_settings(
+        MIDDLEWARE=settings.MIDDLEWARE + (
+            'wordpress_api.middleware.ServerTimingMiddleware',),
+        WP_API_TIMING_SAMPLE_RATE=0)
+    @responses.activate
+    def test_unsampled_requests_are_not_timed(self):
+        response = self.client.get(reverse('wordpress_api_blog_list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class TestProfiling(TestCase):
+    """
+    Tests for wordpress_api.profiling
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_responses(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+
+    @responses.activate
+    def test_sampled_requests_are_profiled_and_rotated(self):
+        self.add_responses()
+        with self.settings(WP_API_PROFILE_DIR=self.directory,
+                           WP_API_PROFILE_SAMPLE_RATE=1,
+                           WP_API_PROFILE_KEEP=1):
+            self.client.get(reverse('wordpress_api_blog_list'))
+            self.client.get(
+                reverse('wordpress_api_blog_tag_list', args=['test']))
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(2, len(files))
+        self.assertTrue(files[0].endswith('TagBlogListView.get.json'))
+        with open(os.path.join(self.directory, files[0])) as metadata:
+            metadata = json.load(metadata)
+        self.assertEqual('/tag/test/', metadata['path'])
+        self.assertEqual('sampled', metadata['reason'])
+
+    @responses.activate
+    def test_profile_errors_never_fail_the_request(self):
+        self.add_responses()
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'excerpt': 'test',
+                   'title': 'Test', 'date': '2007-01-25T12:00:00Z'}],
+            status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '1'})
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        with self.settings(WP_API_PROFILE_DIR=os.path.join(blocker, 'x'),
+                           WP_API_PROFILE_SAMPLE_RATE=1), \
+                self.assertLogs('wordpress_api.profiling', 'ERROR'):
+            response = self.client.get(
+                reverse('wordpress_api_blog_tag_list', args=['test']))
+        self.assertEqual(200, response.status_code)
+
+    @responses.activate
+    def test_fast_requests_are_not_kept(self):
+        self.add_responses()
+        with self.settings(WP_API_PROFILE_DIR=self.directory,
+                           WP_API_PROFILE_THRESHOLD=60):
+            self.client.get(reverse('wordpress_api_blog_list'))
+        self.assertEqual([], os.listdir(self.directory))
+
+    @responses.activate
+    def test_one_profile_runs_at_a_time(self):
+        self.add_responses()
+        with self.settings(WP_API_PROFILE_DIR=self.directory,
+                           WP_API_PROFILE_SAMPLE_RATE=1), \
+                profiling._profiler_lock:
+            response = self.client.get(reverse('wordpress_api_blog_list'))
+        self.assertNotEqual(500, response.status_code)
+        self.assertEqual([], os.listdir(self.directory))
+
+
+class TestDebugOverlay(TestCase):
+    """
+    Tests for wordpress_api.middleware.DebugOverlayMiddleware
+    """
+
+    def test_analyze_calls_flags_duplicates_and_n_plus_one(self):
+        calls = analyze_calls([
+            {'method': 'get_tags', 'url': 'tags?page=1',
+             'params': {'page': 1}, 'cached': False},
+            {'method': 'get_tags', 'url': 'tags?page=2',
+             'params': {'page': 2}, 'cached': False},
+            {'method': 'get_posts', 'url': 'posts?name=a',
+             'params': {'name': 'a'}, 'cached': False},
+            {'method': 'get_posts', 'url': 'posts?name=a',
+             'params': {'name': 'a'}, 'cached': False},
+            {'method': 'get_posts', 'url': 'posts?tag=1',
+             'params': {'tag': 1}, 'cached': False},
+            {'method': 'get_categories', 'url': 'blog_cache_categories_en',
+             'params': {}, 'cached': True},
+        ])
+        self.assertEqual(
+            [False, False, True, True, False, False],
+            [call['duplicate'] for call in calls])
+        self.assertEqual(
+            [False, False, True, True, True, False],
+            [call['n_plus_one'] for call in calls])
+
+    @override_settings(DEBUG=True, MIDDLEWARE=settings.MIDDLEWARE + (
+        'wordpress_api.middleware.DebugOverlayMiddleware',))
+    @responses.activate
+    def test_overlay_lists_upstream_calls(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'tags': [1],
+                   'excerpt': 'test', 'date': '2007-01-25T12:00:00Z',
+                   'date_gmt': '2007-01-25T12:00:00Z'}],
+            status=200)
+        response = self.client.get(
+            reverse('wordpress_api_blog_detail', args=['test-blog']))
+        content = response.content.decode('utf-8')
+        self.assertIn('wordpress-api-debug', content)
+        self.assertIn('get_categories', content)
+        self.assertIn('N+1 pattern', content)
+
+
+class TestFeed(TestCase):
+    """
+    Tests for wordpress_api.feed_views
+    """
+
+    def test_trim_excerpt_handles_rendered_excerpts(self):
+        self.assertEqual('Intro ', trim_excerpt('Intro Continue reading'))
+        self.assertEqual(
+            {'rendered': '<p>Intro '},
+            trim_excerpt({'rendered': '<p>Intro Continue reading</p>'}))
+        self.assertIsNone(trim_excerpt(None))
+
+    def add_responses(self, wp_url=settings.WP_URL, prefix='post'):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                wp_url + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, wp_url + 'wp-json/wp/v2/posts/',
+            json=[{'id': i, 'slug': '{}-{}'.format(prefix, i),
+                   'date': '2007-01-25T12:00:00Z',
+                   'title': {'rendered': 'Post'},
+                   'excerpt': {'rendered': 'Intro'}} for i in range(5)],
+            status=200, adding_headers={'X-WP-Total': '5',
+                                        'X-WP-TotalPages': '1'})
+
+    @responses.activate
+    def test_posts_are_fetched_once_per_feed(self):
+        self.add_responses()
+        response = LatestEntriesFeed()(RequestFactory().get('/feed/'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(5, response.content.decode('utf-8').count('<item>'))
+        posts_calls = [call for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(1, len(posts_calls))
+
+    @override_settings(ROOT_URLCONF=NamespacedUrls)
+    @responses.activate
+    def test_items_link_within_the_feed_namespace(self):
+        self.add_responses()
+        response = self.client.get('/news/feed/')
+        self.assertIn('/news/post-0/</link>',
+                      response.content.decode('utf-8'))
+
+    @override_settings(
+        ROOT_URLCONF=NamespacedUrls,
+        WP_API_SITES={'brand': {'URL': 'http://brand.example.org/'}})
+    @responses.activate
+    def test_concurrent_feeds_keep_their_site(self):
+        self.addCleanup(cache.clear)
+        self.add_responses()
+        self.add_responses('http://brand.example.org/', 'brand')
+        feed = LatestEntriesFeed()
+        news = RequestFactory().get('/news/feed/')
+        news.resolver_match = resolve('/news/feed/', NamespacedUrls)
+        news_feed = feed.get_object(news)
+        brand_feed = feed.get_object(
+            RequestFactory().get('/feed/'), wp_site='brand')
+        self.assertEqual(
+            ['/news/post-0/', '/brand-0/'],
+            [feed.item_link(feed.items(news_feed)[0]),
+             feed.item_link(feed.items(brand_feed)[0])])
+
+
+class TestTransports(TestCase):
+    """
+    Tests for wordpress_api.transports
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.directory, 'blog.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @responses.activate
+    def test_recorded_responses_are_replayed_offline(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=[{'id': 1, 'slug': 'test-blog'}], status=200,
+                      adding_headers={'X-WP-Total': '1',
+                                      'X-WP-TotalPages': '1'})
+        recorder = RecordingTransport(RequestsTransport(), self.cassette)
+        recorded = WPApiConnector(
+            load_meta_data=False, transport=recorder).get_posts()
+        responses.reset()
+        replayed = WPApiConnector(
+            load_meta_data=False,
+            transport=ReplayTransport(self.cassette)).get_posts()
+        self.assertEqual(recorded['body'], replayed['body'])
+        self.assertEqual('1', replayed['headers']['X-WP-TotalPages'])
+        self.assertEqual(
+            recorded['headers']['request_url'],
+            replayed['headers']['request_url'])
+        self.assertEqual(0, len(responses.calls))
+
+    @responses.activate
+    def test_missing_requests_are_server_errors(self):
+        recorder = RecordingTransport(RequestsTransport(), self.cassette)
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/tags/',
+                      json=[], status=200)
+        WPApiConnector(load_meta_data=False, transport=recorder).get_tags()
+        connector = WPApiConnector(
+            load_meta_data=False, transport=ReplayTransport(self.cassette))
+        self.assertEqual([], connector.get_tags())
+        self.assertTrue('server_error' in connector.get_posts())
+
+    @responses.activate
+    def test_fault_injection(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=[{'id': 1, 'slug': 'test-blog'}], status=200,
+                      adding_headers={'X-WP-TotalPages': '1'})
+        rules = [
+            {'url': 'name=broken', 'truncate': True},
+            {'url': 'name=down', 'status': 503},
+            {'url': 'name=slow', 'error': 'timeout'},
+            {'url': 'name=paged', 'total_pages': 3},
+        ]
+        connector = WPApiConnector(
+            load_meta_data=False,
+            transport=FaultInjectingTransport(RequestsTransport(), rules))
+        for slug in ('broken', 'down', 'slow'):
+            self.assertTrue('server_error' in connector.get_posts(
+                wp_filter={'name': slug}))
+        posts = connector.get_posts(wp_filter={'name': 'paged'})
+        self.assertEqual('3', posts['headers']['X-WP-TotalPages'])
+        self.assertEqual(
+            [{'id': 1, 'slug': 'test-blog'}],
+            connector.get_posts(wp_filter={'name': 'test-blog'})['body'])
+        self.assertEqual(3, len(responses.calls))
+
+    @responses.activate
+    def test_injected_latency_beyond_the_timeout_times_out(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=[], status=200)
+        transport = FaultInjectingTransport(
+            RequestsTransport(), [{'latency': 0.05}, {'latency': 0.05}])
+        url = settings.WP_URL + 'wp-json/wp/v2/posts/'
+        start = time.time()
+        self.assertRaises(Timeout, transport.get, url, timeout=0.08)
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(0, len(responses.calls))
+        self.assertEqual(200, transport.get(url, timeout=1).status_code)
+
+    @override_settings(WP_API_FAULT_INJECTION=[
+        {'url': 'posts/.*tag=', 'status': 503}])
+    @responses.activate
+    def test_blog_detail_without_related_posts_on_errors(self):
+        """
+        A failing related posts request leaves them out of the page.
+        """
+        self.addCleanup(cache.clear)
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'tags': [1],
+                   'categories': [1], 'date': '2007-01-25T12:00:00Z'}],
+            status=200)
+        with mock.patch.object(views, 'cache_time', 60):
+            response = self.client.get(
+                reverse('wordpress_api_blog_detail', args=['test-blog']))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.context['related_blogs'])
+        self.assertIsNone(cache.get('blog_cache_detail_related_test-blog_en'))
+
+
+class TestBulkhead(TestCase):
+    """
+    Tests for wordpress_api.bulkhead
+    """
+
+    def test_requests_beyond_the_queue_are_shed(self):
+        bulkhead = Bulkhead(1, queue=0)
+        bulkhead.acquire()
+        self.assertRaises(BulkheadFull, bulkhead.acquire)
+        bulkhead.release()
+        bulkhead.acquire()
+        self.assertEqual(1, bulkhead.active)
+
+    def test_queued_requests_time_out(self):
+        bulkhead = Bulkhead(1, queue=1, timeout=0.01)
+        bulkhead.acquire()
+        self.assertRaises(BulkheadFull, bulkhead.acquire)
+        self.assertEqual(0, bulkhead.waiting)
+
+    def test_cluster_concurrency(self):
+        self.addCleanup(cache.clear)
+        bulkhead = Bulkhead(5, cluster_concurrency=1)
+        bulkhead.acquire()
+        self.assertRaises(BulkheadFull, bulkhead.acquire)
+        self.assertEqual(1, bulkhead.active)
+        bulkhead.release()
+        bulkhead.acquire()
+
+    def test_cluster_counter_outlives_the_requests(self):
+        self.addCleanup(cache.clear)
+        bulkhead = Bulkhead(5, cluster_concurrency=2, cluster_ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            bulkhead.acquire()
+        with mock.patch('time.time', return_value=1050):
+            bulkhead.acquire()
+        # Each acquire pushed the expiry of the counter back.
+        with mock.patch('time.time', return_value=1100):
+            self.assertRaises(BulkheadFull, bulkhead.acquire)
+            bulkhead.release()
+            bulkhead.release()
+        # A counter created again while requests were in flight
+        # never goes below zero.
+        with mock.patch('time.time', return_value=1000):
+            bulkhead.acquire()
+        with mock.patch('time.time', return_value=1100):
+            bulkhead.acquire()
+            bulkhead.release()
+            bulkhead.release()
+            bulkhead.acquire()
+            bulkhead.acquire()
+            self.assertRaises(BulkheadFull, bulkhead.acquire)
+
+    @override_settings(WP_API_BULKHEAD_CONCURRENCY=1, WP_API_BULKHEAD_QUEUE=0)
+    @responses.activate
+    def test_shed_requests_get_stale_responses(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=[{'id': 1, 'slug': 'test-blog'}], status=200)
+        connector = WPApiConnector(load_meta_data=False)
+        fresh = connector.get_posts()
+        get_bulkhead().acquire()
+        self.addCleanup(get_bulkhead().release)
+        self.assertEqual(fresh['body'], connector.get_posts()['body'])
+        self.assertTrue('server_error' in connector.get_posts(
+            wp_filter={'name': 'test-blog'}))
+        self.assertEqual(1, len(responses.calls))
+
+
+class TestRetries(TestCase):
+    """
+    Tests for wordpress_api.retry and the pagination of the connector
+    """
+
+    @override_settings(WP_API_RETRIES=2, WP_API_RETRY_BACKOFF=0)
+    @responses.activate
+    def test_transient_errors_are_retried(self):
+        url = settings.WP_URL + 'wp-json/wp/v2/posts/'
+        responses.add(responses.GET, url, status=502)
+        responses.add(responses.GET, url, status=429,
+                      adding_headers={'Retry-After': '0'})
+        responses.add(responses.GET, url, json=[{'id': 1}], status=200)
+        posts = WPApiConnector(load_meta_data=False).get_posts()
+        self.assertEqual([{'id': 1}], posts['body'])
+        self.assertEqual(3, len(responses.calls))
+
+    def test_retry_after_and_budget(self):
+        budget = RetryBudget(ratio=0.5, capacity=1)
+        policy = RetryPolicy(retries=3, max_backoff=2, budget=budget)
+        response = mock.Mock(headers={'Retry-After': '60'})
+        self.assertIsNone(policy.delay(0, response))
+        response.headers['Retry-After'] = '1'
+        self.assertEqual(1, policy.delay(0, response))
+        # The budget is spent, only two requests earn a new retry.
+        self.assertIsNone(policy.delay(1, response))
+        budget.deposit()
+        budget.deposit()
+        self.assertEqual(1, policy.delay(1, response))
+        self.assertIsNone(policy.delay(3, response))
+
+    @responses.activate
+    def test_failing_later_pages_are_server_errors(self):
+        def tags(request):
+            if 'page=2' in request.url:
+                return (500, {}, '')
+            return (200, {'X-WP-TotalPages': '2'},
+                    json.dumps([{'id': 1, 'slug': 'test', 'name': 'test'}]))
+        responses.add_callback(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/tags/',
+            callback=tags)
+        connector = WPApiConnector(load_meta_data=False)
+        self.assertEqual(
+            {'server_error': 'Server returned status code 500'},
+            connector.get_tags())
+        self.assertEqual(2, len(responses.calls))
+
+
+class TestDeadline(TestCase):
+    """
+    Tests for wordpress_api.deadline
+    """
+
+    def test_nested_deadlines_never_extend(self):
+        self.assertIsNone(remaining())
+        self.assertEqual(30, get_timeout(30))
+        with request_deadline(5):
+            with request_deadline(60):
+                self.assertLessEqual(get_timeout(30), 5)
+            with request_deadline(0):
+                self.assertRaises(DeadlineExceeded, get_timeout, 30)
+            self.assertGreater(remaining(), 0)
+        self.assertIsNone(remaining())
+
+    @responses.activate
+    def test_no_request_after_the_deadline(self):
+        responses.add(responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                      json=[], status=200)
+        connector = WPApiConnector(load_meta_data=False)
+        with request_deadline(0):
+            self.assertTrue('server_error' in connector.get_posts())
+        self.assertEqual(0, len(responses.calls))
+
+    @override_settings(WP_API_DEADLINE_RESERVE=60)
+    @responses.activate
+    def test_related_posts_are_skipped_close_to_the_deadline(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'tags': [1],
+                   'categories': [1], 'date': '2007-01-25T12:00:00Z'}],
+            status=200)
+        view = views.BlogView.as_view(deadline=30)
+        response = view(RequestFactory().get('/test-blog/'), slug='test-blog')
+        self.assertEqual(200, response.status_code)
+        posts_calls = [call for call in responses.calls
+                       if '/posts/' in call.request.url]
+        self.assertEqual(1, len(posts_calls))
+        self.assertIsNone(remaining())
+
+
+class TestOrigins(TestCase):
+    """
+    Tests for wordpress_api.origins
+    """
+
+    def test_fastest_healthy_origin_first(self):
+        pool = OriginPool(['http://a/', 'http://b/', 'http://c/'],
+                          alpha=0.5, max_failures=2, cooldown=60)
+        a, b, c = pool.origins
+        pool.succeeded(a, 0.4)
+        pool.succeeded(b, 0.1)
+        pool.succeeded(c, 0.2)
+        self.assertEqual([b, c, a], pool.ordered())
+        pool.succeeded(b, 0.5)
+        self.assertAlmostEqual(0.3, b.latency)
+        self.assertEqual([c, b, a], pool.ordered())
+        pool.failed(c)
+        self.assertEqual([c, b, a], pool.ordered())
+        pool.failed(c)
+        self.assertEqual([b, a, c], pool.ordered())
+
+    @override_settings(WP_URLS=['http://a.example.org/',
+                                'http://b.example.org/'],
+                       WP_API_ORIGIN_MAX_FAILURES=1)
+    @responses.activate
+    def test_connector_fails_over(self):
+        responses.add(responses.GET,
+                      'http://a.example.org/wp-json/wp/v2/posts/', status=503)
+        responses.add(responses.GET,
+                      'http://b.example.org/wp-json/wp/v2/posts/',
+                      json=[{'id': 1}], status=200)
+        connector = WPApiConnector(load_meta_data=False)
+        self.assertEqual([{'id': 1}], connector.get_posts()['body'])
+        self.assertEqual([{'id': 1}], connector.get_posts()['body'])
+        self.assertEqual(
+            ['a.example.org', 'b.example.org', 'b.example.org'],
+            [call.request.url.split('/')[2] for call in responses.calls])
+
+    def test_slow_requests_are_hedged(self):
+        def send(url):
+            if url == 'http://a/':
+                time.sleep(0.5)
+            return mock.Mock(status_code=200, url=url)
+        pool = OriginPool(['http://a/', 'http://b/'], hedge_delay=0.01)
+        start = time.time()
+        self.assertEqual('http://b/', pool.call(send).url)
+        self.assertLess(time.time() - start, 0.4)
+        # Without budget the request waits for the first node.
+        pool = OriginPool(['http://a/', 'http://b/'], hedge_delay=0.01,
+                          hedge_budget=RetryBudget(ratio=0, capacity=0))
+        self.assertEqual('http://a/', pool.call(send).url)
+
+    def test_hedge_delay_from_the_p95(self):
+        pool = OriginPool(['http://a/', 'http://b/'], hedge_delay='p95')
+        self.assertIsNone(pool.hedge_after())
+        for i in range(100):
+            pool.succeeded(pool.origins[0], i / 100.0)
+        self.assertEqual(0.94, pool.hedge_after())
+
+
+@override_settings(WP_API_SITES={
+    'brand': {'URL': 'http://brand.example.org/', 'CACHE_TIMEOUT': 60,
+              'POSTS_PER_PAGE': 5}})
+class TestSites(TestCase):
+    """
+    Tests for wordpress_api.sites
+    """
+
+    def tearDown(self):
+        cache.clear()
+
+    def add_taxonomies(self, wp_url):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET, wp_url + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+
+    def test_registry(self):
+        site = get_site('brand')
+        self.assertIs(site, get_site('brand'))
+        self.assertEqual('http://brand.example.org/', site.url)
+        self.assertEqual('brand:blog_list_cache', site.cache_key(
+            'blog_list_cache'))
+        self.assertEqual(settings.WP_URL, get_site().url)
+        self.assertEqual('blog_list_cache', get_site().cache_key(
+            'blog_list_cache'))
+        self.assertRaises(ImproperlyConfigured, get_site, 'missing')
+
+    @responses.activate
+    def test_connector_of_a_site(self):
+        self.add_taxonomies('http://brand.example.org/')
+        connector = WPApiConnector(site='brand')
+        self.assertEqual([{'id': 1, 'slug': 'test', 'name': 'test'}],
+                         cache.get('brand:blog_cache_tags_en'))
+        self.assertIsNone(cache.get('blog_cache_tags_en'))
+        self.assertEqual(5, connector.blog_per_page)
+        self.assertEqual(60, connector.cache_time)
+
+    @override_settings(WP_API_SITE_HOSTS={'brand.example.com': 'brand'},
+                       ALLOWED_HOSTS=['brand.example.com', 'testserver'])
+    @responses.activate
+    def test_views_select_the_site(self):
+        self.add_taxonomies('http://brand.example.org/')
+        responses.add(
+            responses.GET, 'http://brand.example.org/wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'date': '2007-01-25'}],
+            status=200, adding_headers={'X-WP-Total': '1',
+                                        'X-WP-TotalPages': '1'})
+        view = views.BlogListView.as_view()
+        response = view(RequestFactory().get('/'), wp_site='brand')
+        self.assertEqual(200, response.status_code)
+        response = view(RequestFactory().get(
+            '/?page=2', HTTP_HOST='brand.example.com'))
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(cache.get('brand:blog_list_cacheen_page_1'))
+        self.assertTrue(all('brand.example.org' in call.request.url
+                            for call in responses.calls))
+
+
+class TestConnectorPool(TestCase):
+    """
+    Tests for the connectors shared by the requests
+    """
+
+    def setUp(self):
+        clear_connectors()
+        self.addCleanup(clear_connectors)
+        self.addCleanup(cache.clear)
+
+    def add_taxonomies(self, tag_slug):
+        for endpoint in ('users', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/tags/',
+            json=[{'id': 1, 'slug': tag_slug, 'name': tag_slug}],
+            status=200)
+
+    @responses.activate
+    def test_taxonomies_are_shared_until_they_expire(self):
+        self.add_taxonomies('old')
+        with mock.patch('wordpress_api.utils.cache_time', 60):
+            connector = get_connector('en')
+            snapshot = connector.taxonomies
+            self.assertIs(connector, get_connector('en'))
+            self.assertIs(snapshot, connector.taxonomies)
+            self.assertIsNot(connector, get_connector('es'))
+            self.assertEqual(6, len(responses.calls))
+            # An expired snapshot is replaced, from the cache first.
+            cache.clear()
+            responses.reset()
+            self.add_taxonomies('new')
+            connector.taxonomies = snapshot._replace(loaded_at=0)
+            self.assertEqual('new', get_connector('en').tags[0]['slug'])
+
+    @responses.activate
+    def test_taxonomies_without_timeout_never_expire(self):
+        self.add_taxonomies('test')
+        with mock.patch('wordpress_api.utils.cache_time', None):
+            connector = get_connector('en')
+            self.assertIs(connector, get_connector('en'))
+            self.assertEqual(3, len(responses.calls))
+
+    @responses.activate
+    def test_failed_refreshes_keep_the_last_snapshot(self):
+        self.add_taxonomies('old')
+        connector = get_connector('en')
+        responses.reset()
+        connector.refresh_taxonomies(0)
+        self.assertEqual('old', connector.tags[0]['slug'])
+        self.assertFalse(connector.taxonomies.failed)
+
+    @override_settings(
+        WP_API_PREFETCH_ON_STARTUP=True, WP_API_ALLOW_LANGUAGE=True,
+        LANGUAGES=[('en', 'English'), ('es', 'Spanish')])
+    @responses.activate
+    def test_prefetch(self):
+        self.add_taxonomies('test')
+        connectors = prefetch_taxonomies(max_age=60)
+        self.assertEqual(['en', 'es'], [c.lang for c in connectors])
+        self.assertEqual(6, len(responses.calls))
+        # The requests never load the prefetched taxonomies.
+        self.assertIs(connectors[0], get_connector('en'))
+        self.assertEqual(6, len(responses.calls))
+
+    @override_settings(WP_API_PREFETCH_LANGUAGES=['en'])
+    @responses.activate
+    def test_prefetcher_thread(self):
+        self.add_taxonomies('test')
+        prefetcher = Prefetcher(interval=60)
+        prefetcher.start()
+        prefetcher.stop()
+        prefetcher.join(5)
+        self.assertFalse(prefetcher.is_alive())
+        self.assertEqual('test', get_connector('en').tags[0]['slug'])
+
+
+
+class TestSharedTaxonomies(TestCase):
+    """
+    Tests for the taxonomy snapshot files of wordpress_api.shm
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'default-en.taxonomies')
+        self.addCleanup(cache.clear)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_taxonomies(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+
+    def test_snapshot_lookups(self):
+        authors = {u'jos\xe9': {'id': 7, 'slug': u'jos\xe9'}}
+        tags = [{'id': 3, 'slug': 'zope'}, {'id': 1, 'slug': 'apps'},
+                {'id': 2, 'slug': 'django'}]
+        publish(self.path, authors, tags, [], 10.0)
+        authors, tags, categories, loaded_at = read(self.path)
+        self.assertEqual(10.0, loaded_at)
+        self.assertEqual(['zope', 'apps', 'django'],
+                         [tag['slug'] for tag in tags])
+        self.assertEqual(2, tags.by_slug('django')['id'])
+        self.assertIsNone(tags.by_slug('flask'))
+        self.assertEqual('apps', tags.by_id(1)['slug'])
+        self.assertEqual(['zope', 'django'],
+                         [tag['slug'] for tag in tags.with_ids([2, 3, 9])])
+        self.assertEqual('django', tags[-1]['slug'])
+        self.assertEqual(0, len(categories))
+        self.assertEqual(7, authors[u'jos\xe9']['id'])
+        self.assertNotIn('server_error', authors)
+        self.assertNotIn('server_error', tags)
+        # Cached contexts get plain copies.
+        self.assertEqual(
+            {u'jos\xe9': {'id': 7, 'slug': u'jos\xe9'}},
+            pickle.loads(pickle.dumps(authors)))
+        self.assertEqual(list(tags), pickle.loads(pickle.dumps(tags)))
+
+    def test_missing_or_invalid_snapshots(self):
+        self.assertIsNone(read(self.path))
+        with open(self.path, 'wb') as snapshot:
+            snapshot.write(b'not a snapshot')
+        self.assertIsNone(read(self.path))
+
+    @responses.activate
+    def test_connectors_map_the_snapshot_of_the_host(self):
+        self.add_taxonomies()
+        with self.settings(WP_API_SHARED_TAXONOMIES=self.directory), \
+                mock.patch('wordpress_api.utils.cache_time', 60):
+            WPApiConnector()
+            cache.clear()
+            connector = WPApiConnector()
+            self.assertEqual(3, len(responses.calls))
+            self.assertIsInstance(connector.tags, TermTable)
+            self.assertEqual(
+                [{'id': 1, 'slug': 'test', 'name': 'test'}],
+                views.match_terms(connector.categories, [1]))
+            self.assertEqual(
+                'test', views.find_term(connector.tags, 'test')['name'])
+            self.assertIn('test', connector.authors)
+            # An expired snapshot is built again.
+            connector.refresh_taxonomies(0)
+            self.assertEqual(6, len(responses.calls))
+
+    @responses.activate
+    def test_snapshots_without_timeout_never_expire(self):
+        self.add_taxonomies()
+        with self.settings(WP_API_SHARED_TAXONOMIES=self.directory), \
+                mock.patch('wordpress_api.utils.cache_time', None):
+            connector = WPApiConnector()
+            cache.clear()
+            connector.refresh_taxonomies(connector.taxonomies_cache_time)
+            self.assertIsInstance(WPApiConnector().tags, TermTable)
+            self.assertEqual(3, len(responses.calls))
+
+    @override_settings(WP_API_AUTOCOMPLETE=True)
+    @responses.activate
+    def test_mapped_snapshots_fill_the_autocomplete(self):
+        clear_search_indexes()
+        self.addCleanup(clear_search_indexes)
+        publish(self.path, {}, [{'id': 1, 'slug': 'django', 'name': 'Django'}],
+                [{'id': 2, 'slug': 'news', 'name': 'News'}], time.time())
+        with self.settings(WP_API_SHARED_TAXONOMIES=self.directory), \
+                mock.patch('wordpress_api.utils.cache_time', 60):
+            WPApiConnector()
+            response = self.client.get(
+                reverse('wordpress_api_autocomplete'), {'q': 'n'})
+        self.assertEqual(0, len(responses.calls))
+        self.assertEqual(
+            ['news'],
+            [suggestion['slug']
+             for suggestion in response.json()['suggestions']])
+        self.assertEqual(
+            'django', get_prefix_index('en').suggest('dj')[0]['slug'])
+
+
+class TestCacheSnapshots(TestCase):
+    """
+    Tests for the snapshots of the blog cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.snapshot')
+        self.addCleanup(cache.clear)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fill_cache(self):
+        cache_add('blog_list_cacheen_page_1', {'blogs': []}, 60)
+        cache_add('blog_cache_tags_en', [{'id': 1}], None)
+        cache_add('blog_cache_expired', 'gone', 0)
+        cache.set('unregistered', 'value')
+
+    def test_dump_and_load(self):
+        with self.settings(WP_API_CACHE_SNAPSHOT=self.path):
+            self.fill_cache()
+            output = StringIO()
+            call_command('wp_cache_dump', stdout=output)
+            self.assertIn('Saved 2 cache entries', output.getvalue())
+            cache.clear()
+            call_command('wp_cache_load', stdout=output)
+            self.assertIn('Restored 2 cache entries', output.getvalue())
+        self.assertEqual({'blogs': []}, cache.get('blog_list_cacheen_page_1'))
+        self.assertEqual([{'id': 1}], cache.get('blog_cache_tags_en'))
+        self.assertIsNone(cache.get('unregistered'))
+
+    def test_restore_on_startup(self):
+        with self.settings(WP_API_CACHE_SNAPSHOT=self.path):
+            self.fill_cache()
+            call_command('wp_cache_dump', stdout=StringIO())
+            # The cache still has the registry, nothing was lost.
+            self.assertEqual(0, restore_on_startup())
+            cache.clear()
+            self.assertEqual(2, restore_on_startup())
+            self.assertEqual(0, restore_on_startup())
+        self.assertEqual([{'id': 1}], cache.get('blog_cache_tags_en'))
+
+    def test_snapshotter_restores_a_lost_cache(self):
+        with self.settings(WP_API_CACHE_SNAPSHOT=self.path):
+            self.fill_cache()
+            self.assertIn('blog_cache_tags_en',
+                          cache.get(registry_key('blog_cache_tags_en')))
+            call_command('wp_cache_dump', stdout=StringIO())
+            restore_on_startup()
+            snapshotter = Snapshotter(self.path, 60)
+            snapshotter.stopped.wait = mock.Mock(side_effect=[False, True])
+            # The cache servers restart.
+            cache.clear()
+            cache_add('blog_cache_new', 'new', 60)
+            snapshotter.run()
+            self.assertEqual([{'id': 1}], cache.get('blog_cache_tags_en'))
+            snapshotter.stopped.wait = mock.Mock(side_effect=[False, True])
+            snapshotter.run()
+            cache.clear()
+            self.assertEqual(3, load_cache(self.path))
+
+    def test_commands_take_a_relative_path(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        with self.settings(WP_API_CACHE_SNAPSHOT='blog.snapshot'):
+            self.fill_cache()
+            call_command('wp_cache_dump', stdout=StringIO())
+            cache.clear()
+            output = StringIO()
+            call_command('wp_cache_load', 'blog.snapshot', stdout=output)
+        self.assertIn('Restored 2 cache entries', output.getvalue())
+        self.assertEqual(['blog.snapshot'], os.listdir(self.directory))
+
+    def test_commands_need_a_snapshot_file(self):
+        self.assertRaises(CommandError, call_command, 'wp_cache_dump')
+        self.assertRaises(
+            CommandError, call_command, 'wp_cache_load', self.path)
+
+
+class TestCacheTtls(TestCase):
+    """
+    Tests for the per resource cache timeouts
+    """
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_timeout_rules(self):
+        ttls = {'list': 60, 'detail': [(30 * 86400, 86400), (86400, 600)]}
+        self.assertEqual(60, cache_timeout('list', 10, ttls=ttls))
+        self.assertEqual(10, cache_timeout('related', 10, ttls=ttls))
+        self.assertEqual(
+            86400, cache_timeout('detail', 10, 90 * 86400, ttls))
+        self.assertEqual(600, cache_timeout('detail', 10, 2 * 86400, ttls))
+        self.assertEqual(10, cache_timeout('detail', 10, 3600, ttls))
+        self.assertEqual(10, cache_timeout('detail', 10, ttls=ttls))
+
+    @override_settings(WP_API_CACHE_TTLS={
+        'taxonomies': 3600, 'list_first_page': 30, 'list': 600,
+        'detail': [(30 * 86400, 86400)]})
+    @responses.activate
+    def test_views_use_the_resource_timeouts(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'excerpt': 'test',
+                   'date': '2007-01-25T12:00:00Z'}],
+            status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '2'})
+        with mock.patch.object(views, 'cache_time', 60), \
+                mock.patch.object(
+                    caching, 'cache_add', wraps=caching.cache_add) as add:
+            self.client.get(
+                reverse('wordpress_api_blog_detail', args=['test-blog']))
+            self.client.get(reverse('wordpress_api_blog_list'))
+            self.client.get(reverse('wordpress_api_blog_list') + '?page=2')
+        timeouts = dict((args[0], args[2]) for args, _ in add.call_args_list)
+        self.assertEqual(86400, timeouts['blog_cache_detail_test-blog_en'])
+        self.assertEqual(30, timeouts['blog_list_cacheen_page_1'])
+        self.assertEqual(600, timeouts['blog_list_cacheen_page_2'])
+        self.assertEqual(3600, get_connector('en').taxonomies_cache_time)
+
+
+class TestEarlyExpiration(TestCase):
+    """
+    Tests for the probabilistic early expiration of the cache
+    """
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    @override_settings(WP_API_CACHE_EARLY_EXPIRATION=1)
+    def test_values_are_refreshed_before_they_expire(self):
+        self.assertIsNone(cache_get('blog_list_cacheen_page_1', 'blog_list'))
+        cache_add('blog_list_cacheen_page_1', 'first', 60)
+        cached = cache.get('blog_list_cacheen_page_1')
+        self.assertEqual('first', cached.value)
+        self.assertAlmostEqual(time.time() + 60, cached.expires, places=0)
+        # A value slow to compute is refreshed once close to expire.
+        cache.set('blog_list_cacheen_page_1',
+                  CachedValue('old', 10, time.time() + 60), 60)
+        with mock.patch('wordpress_api.caching.random.random',
+                        return_value=0.5):
+            self.assertEqual(
+                'old', cache_get('blog_list_cacheen_page_1', 'blog_list'))
+            cache.set('blog_list_cacheen_page_1',
+                      CachedValue('old', 10, time.time() + 1), 60)
+            self.assertIsNone(
+                cache_get('blog_list_cacheen_page_1', 'blog_list'))
+            cache_add('blog_list_cacheen_page_1', 'new', 60)
+            self.assertEqual(
+                'new', cache_get('blog_list_cacheen_page_1', 'blog_list'))
+
+    @override_settings(WP_API_CACHE_EARLY_EXPIRATION=1)
+    @responses.activate
+    def test_failed_refreshes_serve_the_cached_value(self):
+        for endpoint in ('users', 'tags', 'categories'):
+            responses.add(
+                responses.GET,
+                settings.WP_URL + 'wp-json/wp/v2/{}/'.format(endpoint),
+                json=[{'id': 1, 'slug': 'test', 'name': 'test'}],
+                status=200)
+        responses.add(
+            responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+            json=[{'id': 1, 'slug': 'test-blog', 'excerpt': 'test',
+                   'title': 'Test', 'date': '2007-01-25T12:00:00Z'}],
+            status=200,
+            adding_headers={'X-WP-Total': '1', 'X-WP-TotalPages': '1'})
+        urls = (reverse('wordpress_api_blog_list'),
+                reverse('wordpress_api_blog_detail', args=['test-blog']))
+        keys = ('blog_list_cacheen_page_1', 'blog_cache_detail_test-blog_en')
+        with mock.patch.object(views, 'cache_time', 60):
+            for url in urls:
+                self.assertEqual(200, self.client.get(url).status_code)
+            responses.reset()
+            responses.add(
+                responses.GET, settings.WP_URL + 'wp-json/wp/v2/posts/',
+                status=502)
+            for url, key in zip(urls, keys):
+                expiring = cache.get(key)._replace(
+                    delta=10, expires=time.time() + 1)
+                cache.set(key, expiring, 60)
+                with mock.patch('wordpress_api.caching.random.random',
+                                return_value=0.5):
+                    self.assertEqual(200, self.client.get(url).status_code)
+                self.assertEqual(expiring, cache.get(key))
+
+    def test_values_are_stored_as_is_by_default(self):
+        cache.set('blog_cache_tags_en', CachedValue([], 0, None), 60)
+        self.assertEqual([], cache_get('blog_cache_tags_en', 'tags'))
+        cache_add('blog_cache_categories_en', [], 60)
+        self.assertEqual([], cache.get('blog_cache_categories_en'))
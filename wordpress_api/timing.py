@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """
+    Accumulates the time spent in each phase of a request.
+    Nested phases are subtracted from their parent, so every
+    phase reports its own time only.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = OrderedDict()
+        self.cache_lookups = []
+        self.upstream_calls = []
+        self._stack = []
+
+    def add(self, name, duration):
+        total, count = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + duration, count + 1)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def server_timing(self, total=None):
+        """
+        Returns the value of the Server-Timing header, durations
+        in milliseconds. The time outside every phase is 'app'.
+        """
+        total = self.elapsed() if total is None else total
+        metrics = []
+        accounted = 0.0
+        for name, (duration, count) in self.phases.items():
+            accounted += duration
+            metrics.append('{};dur={:.1f};desc="{} calls"'.format(
+                name, duration * 1000, count))
+        metrics.append('app;dur={:.1f}'.format(
+            max(total - accounted, 0) * 1000))
+        metrics.append('total;dur={:.1f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+
+class phase(object):
+    """
+    Context manager that attributes the time of its block to
+    the given phase of the current request, if it is timed.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.timer = None
+
+    def __enter__(self):
+        self.timer = getattr(_local, 'timer', None)
+        if self.timer is not None:
+            self.timer._stack.append(0.0)
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timer is None:
+            return
+        elapsed = time.time() - self.start
+        nested = self.timer._stack.pop()
+        self.timer.add(self.name, elapsed - nested)
+        if self.timer._stack:
+            self.timer._stack[-1] += elapsed
+
+
+def start():
+    _local.timer = RequestTimer()
+    return _local.timer
+
+
+def stop():
+    timer = getattr(_local, 'timer', None)
+    _local.timer = None
+    return timer
+
+
+def current():
+    return getattr(_local, 'timer', None)
+
+
+def record_upstream(**call):
+    """
+    Adds a connector call to the current request, if it is timed.
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is not None:
+        timer.upstream_calls.append(call)
@@ -0,0 +1,205 @@
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from requests.exceptions import ConnectionError, Timeout
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlencode
+
+# Headers that do not apply to the decoded body stored in a cassette.
+SKIPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+def request_key(url, params=None):
+    return url + '?' + urlencode(sorted((params or {}).items()))
+
+
+class RequestsTransport(object):
+    """
+    Default transport, a requests session so connections to
+    wordpress are kept alive and reused.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def get(self, url, params=None, timeout=30, auth=None):
+        return self.session.get(
+            url, params=params, timeout=timeout, auth=auth)
+
+
+class RecordingTransport(object):
+    """
+    Sends the requests through the inner transport and appends every
+    response, headers included, to a gzipped JSON lines cassette.
+    """
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=30, auth=None):
+        response = self.inner.get(
+            url, params=params, timeout=timeout, auth=auth)
+        record = {
+            'key': request_key(url, params),
+            'url': response.url,
+            'status': response.status_code,
+            'headers': dict(
+                (name, value) for name, value in response.headers.items()
+                if name.lower() not in SKIPPED_HEADERS),
+            'body': response.content.decode('utf-8'),
+        }
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode(
+            'utf-8')
+        with self._lock:
+            with gzip.open(self.path, 'ab') as cassette:
+                cassette.write(line)
+        return response
+
+
+class ReplayTransport(object):
+    """
+    Serves the responses of a cassette without network access.
+    The last recorded response of a request wins. Requests missing
+    from the cassette raise ConnectionError, like an unreachable server.
+    """
+
+    def __init__(self, path):
+        self.records = {}
+        with gzip.open(path, 'rb') as cassette:
+            for line in cassette:
+                if line.strip():
+                    record = json.loads(line.decode('utf-8'))
+                    self.records[record['key']] = record
+
+    def get(self, url, params=None, timeout=30, auth=None):
+        record = self.records.get(request_key(url, params))
+        if record is None:
+            raise ConnectionError(
+                'No recorded response for {}'.format(
+                    request_key(url, params)))
+        response = requests.Response()
+        response.status_code = record['status']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response._content = record['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = record['url']
+        return response
+
+
+class FaultInjectingTransport(object):
+    """
+    Wraps a transport and degrades the requests matching its rules.
+    Every rule is a dict with the optional keys:
+
+    * url: regular expression searched in the url with its params.
+    * probability: chance of applying the rule, 1 by default.
+    * latency: seconds to wait before the request. Requests whose
+      timeout is shorter wait for the timeout and raise Timeout.
+    * error: 'timeout' or 'connection' to raise that error.
+    * status: status code returned instead of the real response.
+    * truncate: True to cut the response body in half.
+    * total_pages: value of the X-WP-TotalPages header.
+
+    Every matching rule is applied, in order.
+    """
+
+    def __init__(self, inner, rules, seed=None):
+        self.inner = inner
+        self.rules = [dict(rule, url=re.compile(rule.get('url', '')))
+                      for rule in rules]
+        self.random = random.Random(seed)
+
+    def get(self, url, params=None, timeout=30, auth=None):
+        key = request_key(url, params)
+        rules = [rule for rule in self.rules
+                 if rule['url'].search(key) and
+                 self.random.random() < rule.get('probability', 1)]
+        waited = 0
+        for rule in rules:
+            if rule.get('latency'):
+                if timeout and waited + rule['latency'] >= timeout:
+                    # The upstream is slower than the request allows.
+                    time.sleep(max(timeout - waited, 0))
+                    raise Timeout('Injected latency for {}'.format(key))
+                time.sleep(rule['latency'])
+                waited += rule['latency']
+            if rule.get('error') == 'timeout':
+                raise Timeout('Injected timeout for {}'.format(key))
+            if rule.get('error') == 'connection':
+                raise ConnectionError('Injected error for {}'.format(key))
+            if rule.get('status'):
+                response = requests.Response()
+                response.status_code = rule['status']
+                response.headers = CaseInsensitiveDict(
+                    {'Content-Type': 'application/json'})
+                response._content = b'{"code":"injected_error"}'
+                response.encoding = 'utf-8'
+                response.url = key
+                return response
+        response = self.inner.get(
+            url, params=params, timeout=timeout, auth=auth)
+        for rule in rules:
+            if rule.get('truncate'):
+                response._content = response.content[
+                    :len(response.content) // 2]
+            if 'total_pages' in rule:
+                response.headers['X-WP-TotalPages'] = str(
+                    rule['total_pages'])
+        return response
+
+
+_transport = None
+
+
+def build_transport(path=None):
+    """
+    Returns a new transport. path is a dotted path to the transport
+    class, WP_API_TRANSPORT by default. WP_API_REPLAY_CASSETTE
+    replays a cassette, WP_API_RECORD_CASSETTE records one and the
+    rules of WP_API_FAULT_INJECTION degrade the requests.
+    """
+    replay = getattr(settings, 'WP_API_REPLAY_CASSETTE', None)
+    path = path or getattr(settings, 'WP_API_TRANSPORT', None)
+    if replay:
+        transport = ReplayTransport(replay)
+    elif path:
+        transport = import_string(path)()
+    else:
+        transport = RequestsTransport()
+    record = getattr(settings, 'WP_API_RECORD_CASSETTE', None)
+    if record:
+        transport = RecordingTransport(transport, record)
+    faults = getattr(settings, 'WP_API_FAULT_INJECTION', None)
+    if faults:
+        transport = FaultInjectingTransport(transport, faults)
+    return transport
+
+
+def get_transport():
+    """
+    Returns the process wide transport, see build_transport.
+    """
+    global _transport
+    if _transport is None:
+        _transport = build_transport()
+    return _transport
+
+
+def reset_transport(**kwargs):
+    global _transport
+    if kwargs.get('setting') in (
+            None, 'WP_API_TRANSPORT', 'WP_API_REPLAY_CASSETTE',
+            'WP_API_RECORD_CASSETTE', 'WP_API_FAULT_INJECTION'):
+        _transport = None
+
+
+setting_changed.connect(reset_transport)
@@ -8,6 +8,8 @@ urlpatterns = [
     url(r'^category/(?P<slug>[-\w]+)/$',
         views.CategoryBlogListView.as_view(),
         name='wordpress_api_blog_category_list'),
+    url(r'^autocomplete/$', views.AutocompleteView.as_view(),
+        name='wordpress_api_autocomplete'),
     url(r'^(?P<slug>[-\w]+)/$', views.BlogView.as_view(),
         name='wordpress_api_blog_detail'),
     url(r'^tag/(?P<slug>[-\w]+)/$',
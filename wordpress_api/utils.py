@@ -1,9 +1,24 @@
-import requests
+import threading
+import time
 import six
+from collections import namedtuple
 from django.conf import settings
+from django.core.signals import setting_changed
 from requests.exceptions import ConnectionError, Timeout
-from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from . import deadline, shm, timing
+from .bulkhead import BulkheadFull, get_bulkhead
+from .caching import cache_add, cache_get, cache_keep, cache_timeout
+from .metrics import get_exporter
+from django.utils.translation import get_language
+from .related import get_related_index, local_related_enabled
+from .retry import get_retry_policy
+from .transports import get_transport, request_key
+from .search import (
+    SearchIndex, autocomplete_enabled, claim_build, get_prefix_index,
+    get_search_index, local_search_enabled, release_build,
+    search_refresh_interval, set_search_index)
+from .sites import Site, get_site
 try:
     cache_time = settings.WP_API_BLOG_CACHE_TIMEOUT
 except AttributeError:
@@ -15,29 +30,312 @@ except AttributeError:  # pragma: no cover
     blog_per_page = 10
 
 
+def get_blog_language():
+    """
+    Returns the active language if WP_API_ALLOW_LANGUAGE
+    is set, english otherwise.
+    """
+    try:
+        allow_language = settings.WP_API_ALLOW_LANGUAGE
+        if allow_language:
+            return str(get_language())
+    except AttributeError:
+        pass
+    return 'en'
+
+
+class Taxonomies(namedtuple(
+        'Taxonomies', 'authors tags categories loaded_at')):
+    """
+    Snapshot of the authors, tags and categories of a connector.
+    Snapshots are shared by the requests, so they are never changed,
+    only replaced.
+    """
+    __slots__ = ()
+
+    @property
+    def failed(self):
+        return any('server_error' in terms
+                   for terms in (self.authors, self.tags, self.categories))
+
+
+# Connector method of each endpoint, as reported in the debug overlay.
+ENDPOINT_METHODS = {
+    'posts': 'get_posts',
+    'tags': 'get_tags',
+    'categories': 'get_categories',
+    'users': 'get_authors',
+}
+
+
 class WPApiConnector(object):
 
-    def __init__(self, lang='en', auth=None, load_meta_data=True):
+    def __init__(self, lang='en', auth=None, load_meta_data=True,
+                 transport=None, site=None):
         self.lang = lang
-        self.wp_url = settings.WP_URL
-        self.blog_per_page = blog_per_page
+        self.site = site if isinstance(site, Site) else get_site(site)
+        self.namespace = self.site.namespace(lang)
+        self.transport = transport or self.site.transport or get_transport()
+        self.wp_url = self.site.url
+        self.origins = self.site.origins
+        self.blog_per_page = self.site.posts_per_page or blog_per_page
         if not self.wp_url:
             raise ImproperlyConfigured("Missing wordpress url")
         self.auth = None
+        self._refresh_lock = threading.Lock()
         if load_meta_data:
-            authors = cache.get("blog_cache_authors_detail_{}".format(
-                self.lang))
-            self.authors = self.get_authors() if authors is None else authors
-            tags = cache.get("blog_cache_tags_{}".format(self.lang))
-            self.tags = self.get_tags() if tags is None else tags
-            categories = cache.get("blog_cache_categories_{}".format(
-                self.lang))
-            self.categories = self.get_categories()\
-                if categories is None else categories
+            self.taxonomies = self.load_taxonomies()
         else:
-            self.authors = {}
-            self.categories = []
-            self.tags = []
+            self.taxonomies = Taxonomies({}, [], [], time.time())
+
+    @property
+    def authors(self):
+        return self.taxonomies.authors
+
+    @property
+    def tags(self):
+        return self.taxonomies.tags
+
+    @property
+    def categories(self):
+        return self.taxonomies.categories
+
+    def load_taxonomies(self, max_age=None):
+        """
+        Returns a new snapshot of the authors, tags and categories.
+        With WP_API_SHARED_TAXONOMIES, it is mapped from the snapshot
+        file of the host unless that is older than max_age seconds,
+        the cache timeout by default. One process of the host then
+        builds a new file while the others keep the current one.
+        """
+        path = shm.snapshot_path(self.site, self.lang)
+        if path is None:
+            return self._fetch_taxonomies()
+        if max_age is None:
+            max_age = self.taxonomies_cache_time
+            if getattr(settings, 'WP_API_PREFETCH_ON_STARTUP', False):
+                # The prefetch thread refreshes the file.
+                max_age = float('inf')
+        if max_age is None:
+            # A None cache timeout never expires.
+            max_age = float('inf')
+        shared = shm.read(path)
+        if shared is not None and time.time() - shared[3] < max_age:
+            return self._map_taxonomies(shared)
+        with shm.build_lock(path) as building:
+            if not building:
+                # Another process of the host is building the file.
+                if shared is not None:
+                    return self._map_taxonomies(shared)
+                return self._fetch_taxonomies()
+            latest = shm.read(path)
+            if latest is not None and time.time() - latest[3] < max_age:
+                return self._map_taxonomies(latest)
+            taxonomies = self._fetch_taxonomies()
+            if taxonomies.failed:
+                return taxonomies
+            shm.publish(path, *taxonomies)
+        shared = shm.read(path)
+        if shared is None:
+            return taxonomies
+        return self._map_taxonomies(shared)
+
+    def _map_taxonomies(self, shared):
+        """
+        Returns the taxonomies of a mapped snapshot file. The prefix
+        index of the autocomplete is filled from its terms, as this
+        process never fetches them.
+        """
+        taxonomies = Taxonomies(*shared)
+        if autocomplete_enabled():
+            index = get_prefix_index(self.namespace)
+            index.update_terms('tag', taxonomies.tags)
+            index.update_terms('category', taxonomies.categories)
+        return taxonomies
+
+    def _fetch_taxonomies(self):
+        """
+        Returns a new snapshot of the authors, tags and categories,
+        from the cache or from wordpress.
+        """
+        authors_key = self.site.cache_key(
+            "blog_cache_authors_detail_{}".format(self.lang))
+        tags_key = self.site.cache_key(
+            "blog_cache_tags_{}".format(self.lang))
+        categories_key = self.site.cache_key(
+            "blog_cache_categories_{}".format(self.lang))
+        terms = []
+        for method, key, family in (
+                (self.get_authors, authors_key, 'authors'),
+                (self.get_tags, tags_key, 'tags'),
+                (self.get_categories, categories_key, 'categories')):
+            value, previous = cache_get(key, family, stale=True)
+            if value is not None:
+                timing.record_upstream(
+                    method=method.__name__, url=key, params={}, time=0,
+                    bytes=0, status=None, cached=True)
+            else:
+                value = method()
+                if 'server_error' in value and previous is not None:
+                    # Refreshing them early failed, the cached terms
+                    # are still valid.
+                    cache_keep(key)
+                    value = previous
+            terms.append(value)
+        authors, tags, categories = terms
+        if autocomplete_enabled():
+            index = get_prefix_index(self.namespace)
+            # Terms cached by another worker are indexed as well,
+            # update_terms does nothing when they did not change.
+            if 'server_error' not in tags:
+                index.update_terms('tag', tags)
+            if 'server_error' not in categories:
+                index.update_terms('category', categories)
+        return Taxonomies(authors, tags, categories, time.time())
+
+    def refresh_taxonomies(self, max_age):
+        """
+        Swaps in a new snapshot of the taxonomies if the current one
+        is older than max_age seconds or failed. While a thread
+        refreshes, the others keep reading the current snapshot. A
+        failed refresh keeps the last good snapshot. A None max_age
+        never expires.
+        """
+        if max_age is None:
+            max_age = float('inf')
+        current = self.taxonomies
+        if not current.failed and time.time() - current.loaded_at < max_age:
+            return
+        if not self._refresh_lock.acquire(False):
+            if not current.failed:
+                return
+            # Nothing good to serve, wait for the running refresh.
+            self._refresh_lock.acquire()
+            if self.taxonomies is not current:
+                self._refresh_lock.release()
+                return
+        try:
+            taxonomies = self.load_taxonomies(max_age)
+            if not taxonomies.failed or current.failed:
+                self.taxonomies = taxonomies
+        finally:
+            self._refresh_lock.release()
+
+    @property
+    def cache_time(self):
+        if self.site.cache_timeout is not None:
+            return self.site.cache_timeout
+        return cache_time
+
+    @property
+    def taxonomies_cache_time(self):
+        """
+        Timeout of the authors, tags and categories, the taxonomies
+        entry of WP_API_CACHE_TTLS if there is one.
+        """
+        return cache_timeout(
+            'taxonomies', self.cache_time, ttls=self.site.cache_ttls)
+
+    def _get(self, endpoint, params):
+        """
+        Performs a GET to the given wp-json/wp/v2 endpoint through
+        the connector transport, within the bulkhead and with the
+        retry policy if there are. With several wordpress origins,
+        the request fails over from the fastest healthy one to the
+        others. The timeout is shrunk to the deadline of the request.
+        Every request is recorded by the metrics exporter.
+        """
+        path = 'wp-json/wp/v2/{}/'.format(endpoint)
+        query = self.wp_url + path
+        exporter = get_exporter()
+        bulkhead = get_bulkhead()
+        policy = get_retry_policy()
+        start = time.time()
+
+        def get(wp_url):
+            return self.transport.get(
+                wp_url + path, params=params,
+                timeout=deadline.get_timeout(30), auth=self.auth)
+
+        def fetch():
+            if self.origins is None:
+                return get(self.wp_url)
+            return self.origins.call(get)
+
+        def send():
+            if bulkhead is None:
+                return fetch()
+            return bulkhead.call(request_key(query, params), fetch)
+        try:
+            with timing.phase('upstream'):
+                response = send() if policy is None else policy.call(send)
+        except (ConnectionError, Timeout) as error:
+            elapsed = time.time() - start
+            if isinstance(error, BulkheadFull):
+                status = 'shed'
+            elif isinstance(error, deadline.DeadlineExceeded):
+                status = 'deadline'
+            else:
+                status = 'error'
+            exporter.record_request(endpoint, status, elapsed, 0)
+            timing.record_upstream(
+                method=ENDPOINT_METHODS.get(endpoint, endpoint),
+                url=request_key(query, params),
+                params=dict(params), time=elapsed, bytes=0,
+                status=status, cached=False)
+            raise
+        elapsed = time.time() - start
+        size = len(response.content or b'')
+        exporter.record_request(
+            endpoint, response.status_code, elapsed, size)
+        timing.record_upstream(
+            method=ENDPOINT_METHODS.get(endpoint, endpoint),
+            url=response.url, params=dict(params), time=elapsed,
+            bytes=size, status=response.status_code, cached=False)
+        return response
+
+    def _get_all_pages(self, endpoint, params, max_pages=None):
+        """
+        Gets every page of a list endpoint, at most max_pages, and
+        returns the items of all the pages. A server_error dict is
+        returned if any page fails.
+        """
+        params = dict(params)
+        if self.lang is not None:
+            params['lang'] = self.lang
+        items = []
+        page = 1
+        total_pages = 1
+        while page <= total_pages:
+            if page > 1:
+                params['page'] = page
+            try:
+                response = self._get(endpoint, params)
+            except (ConnectionError, Timeout):
+                return {'server_error': 'The server is not reachable this \
+                        moment please try again later'}
+            if response.status_code != 200:
+                return {
+                    'server_error': 'Server returned status code %i' %
+                    response.status_code}
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            if not isinstance(data, list):
+                return {'server_error': 'Server returned an invalid response'}
+            items += data
+            if page == 1:
+                try:
+                    total_pages = int(
+                        response.headers.get('X-WP-TotalPages', 1))
+                except ValueError:  # pragma: no cover
+                    total_pages = 1
+                if max_pages is not None:
+                    total_pages = min(total_pages, max_pages)
+            page += 1
+        get_exporter().record_pages(endpoint, page - 1)
+        return items
 
     def get_authors(self):
         """
@@ -45,42 +343,15 @@ class WPApiConnector(object):
         the authors id. This method returns a dict with authors
         slug: author_data as key, value.
         """
-        query = self.wp_url + 'wp-json/wp/v2/users/'
-        params = {'per_page': '100'}
-        page = 1
-        if self.lang is not None:
-            params['lang'] = self.lang
-        try:
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-        except (ConnectionError, Timeout):
-            return {'server_error': 'The server is not reachable this moment\
-                    please try again later'}
-        if response.status_code != 200:
-            return {
-                'server_error': 'Server returned status code %i' % response.
-                status_code}
-        authors = {}
-        data = response.json()
-        for author in data:
-            authors[author['slug']] = author
-        total_pages = response.headers.get('X-WP-TotalPages', 1)
-        try:
-            total_pages = int(total_pages)
-        except ValueError:  # pragma: no cover
-            total_pages = 1
-        for i in range(0, total_pages - 1):
-            page += 1
-            params['page'] = page
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-            data = response.json()
-            for author in data:
-                authors[author['slug']] = author
-
-        cache.add(
-            "blog_cache_authors_detail_{}".format(self.lang),
-            authors, cache_time)
+        authors = self._get_all_pages('users', {'per_page': '100'})
+        if 'server_error' in authors:
+            return authors
+        authors = dict((author['slug'], author) for author in authors)
+
+        cache_add(
+            self.site.cache_key(
+                "blog_cache_authors_detail_{}".format(self.lang)),
+            authors, self.taxonomies_cache_time)
         return authors
 
     def get_posts(self, wp_filter=None, search=None,
@@ -98,9 +369,24 @@ class WPApiConnector(object):
 
         http://wp-api.org/index-deprecated.html#posts_retrieve-posts
         """
-        auth = self.auth
+        if search is not None and wp_filter is None and\
+           custom_type is None and local_search_enabled():
+            index = get_search_index(self.namespace)
+            if not index.is_fresh(search_refresh_interval()):
+                # Until a full sweep of the blog is indexed, wordpress
+                # answers the searches.
+                self.refresh_search_index()
+            else:
+                posts = index.search_page(
+                    search, int(page_number or 1), self.blog_per_page)
+                timing.record_upstream(
+                    method='get_posts',
+                    url=posts['headers']['request_url'],
+                    params={'search': search}, time=0, bytes=0,
+                    status=None, cached=True)
+                return posts
         params = {'_embed': 'true'}
-        query = self.wp_url + 'wp-json/wp/v2/posts/'
+        endpoint = 'posts'
         if orderby == 'title':
             params['order'] = 'asc'
         else:
@@ -122,8 +408,7 @@ class WPApiConnector(object):
         if self.lang is not None:
             params['lang'] = self.lang
         try:
-            response = requests.get(
-                query, params=params, timeout=30, auth=auth)
+            response = self._get(endpoint, params)
         except (ConnectionError, Timeout):
             return {'server_error': 'The server is not reachable this moment\
                     please try again later'}
@@ -134,81 +419,139 @@ class WPApiConnector(object):
                 status_code}
         headers = response.headers or {}
         headers.update({'request_url': response.url})
-        return {'body': response.json(), 'headers': headers, }
+        try:
+            body = response.json()
+        except ValueError:
+            return {'server_error': 'Server returned an invalid response'}
+        get_exporter().record_pages(endpoint, 1)
+        if isinstance(body, list):
+            if local_search_enabled():
+                get_search_index(self.namespace).add_posts(body)
+            if autocomplete_enabled():
+                get_prefix_index(self.namespace).add_posts(body)
+            if local_related_enabled():
+                get_related_index(self.namespace).add_posts(body)
+        return {'body': body, 'headers': headers, }
+
+    def build_search_index(self):
+        """
+        Fetches every post of the blog, 100 per request, into a new
+        local search index, which replaces the current one once every
+        page was fetched. The posts of the sweep do not go through
+        get_posts, they only replace the posts of the local related
+        posts index, when enabled, so deleted posts leave it too.
+        Returns the number of indexed posts, None if the sweep failed.
+        """
+        posts = self._get_all_pages(
+            'posts', {'_embed': 'true', 'per_page': '100',
+                      'orderby': 'date', 'order': 'desc'})
+        if 'server_error' in posts:
+            return None
+        index = SearchIndex()
+        index.add_posts(posts)
+        index.built_at = time.time()
+        set_search_index(self.namespace, index)
+        if local_related_enabled():
+            get_related_index(self.namespace).replace_posts(posts)
+        return len(index)
+
+    def refresh_search_index(self, background=True):
+        """
+        Builds the local search index, in a background thread by
+        default, unless a build of it is running or failed a moment
+        ago. Returns the thread, None if no thread was started.
+        """
+        if not claim_build(self.namespace):
+            return None
+
+        def build():
+            try:
+                self.build_search_index()
+            finally:
+                release_build(self.namespace)
+        if not background:
+            build()
+            return None
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def get_post_slugs(self, max_pages=None):
+        """
+        Gets the slugs of the posts, newest first. Only the slug
+        field is requested. If max_pages is given, at most that many
+        pages of 100 slugs are fetched.
+        """
+        posts = self._get_all_pages(
+            'posts', {'_fields': 'slug', 'per_page': '100',
+                      'orderby': 'date', 'order': 'desc'},
+            max_pages=max_pages)
+        if 'server_error' in posts:
+            return posts
+        return [post['slug'] for post in posts]
 
     def get_tags(self):
         """
         Gets all the tags inside the wordpress application
         """
-        params = {'per_page': '100'}
-        page = 1
-        tags = []
-        query = self.wp_url + "wp-json/wp/v2/tags/"
-        if self.lang is not None:
-            params['lang'] = self.lang
-        try:
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-        except (ConnectionError, Timeout):
-            return {'server_error': 'The server is not reachable this moment\
-                    please try again later'}
-
-        if response.status_code != 200:
-            return {
-                'server_error': 'Server returned status code %i' % response.
-                status_code}
-        tags += response.json()
-        total_pages = response.headers.get('X-WP-TotalPages', 1)
-        try:
-            total_pages = int(total_pages)
-        except ValueError:  # pragma: no cover
-            total_pages = 1
-        for i in range(0, total_pages - 1):
-            page += 1
-            params['page'] = page
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-            tags += response.json()
-        cache.add(
-            "blog_cache_tags_{}".format(self.lang),
-            tags, cache_time)
+        tags = self._get_all_pages('tags', {'per_page': '100'})
+        if 'server_error' in tags:
+            return tags
+        if autocomplete_enabled():
+            get_prefix_index(self.namespace).update_terms('tag', tags)
+        cache_add(
+            self.site.cache_key(
+                "blog_cache_tags_{}".format(self.lang)),
+            tags, self.taxonomies_cache_time)
         return tags
 
     def get_categories(self):
         """
         Gets all the categories inside the wordpress application
         """
-        params = {'per_page': '100'}
-        page = 1
-        categories = []
-        query = self.wp_url + "wp-json/wp/v2/categories/"
-        if self.lang is not None:
-            params['lang'] = self.lang
-        try:
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-        except (ConnectionError, Timeout):
-            return {'server_error': 'The server is not reachable this moment\
-                    please try again later'}
+        categories = self._get_all_pages('categories', {'per_page': '100'})
+        if 'server_error' in categories:
+            return categories
+        if autocomplete_enabled():
+            get_prefix_index(self.namespace).update_terms(
+                'category', categories)
+        cache_add(
+            self.site.cache_key(
+                "blog_cache_categories_{}".format(self.lang)),
+            categories, self.taxonomies_cache_time)
+        return categories
 
-        if response.status_code != 200:
-            return {
-                'server_error': 'Server returned status code %i' % response.
-                status_code}
 
-        categories += response.json()
-        total_pages = response.headers.get('X-WP-TotalPages', 1)
-        try:
-            total_pages = int(total_pages)
-        except ValueError:  # pragma: no cover
-            total_pages = 1
-        for i in range(0, total_pages - 1):
-            page += 1
-            params['page'] = page
-            response = requests.get(
-                query, params=params, timeout=30, auth=self.auth)
-            categories += response.json()
-        cache.add(
-            "blog_cache_categories_{}".format(self.lang),
-            categories, cache_time)
-        return categories
+_connectors = {}
+_connectors_lock = threading.Lock()
+
+
+def get_connector(lang='en', site=None):
+    """
+    Returns the connector of the language and site shared by the
+    requests of the process. Its taxonomies are refreshed once they
+    are older than their cache timeout, or only when they failed if
+    the prefetch thread keeps them fresh.
+    """
+    site = site if isinstance(site, Site) else get_site(site)
+    key = (site.name, lang)
+    connector = _connectors.get(key)
+    if connector is None:
+        connector = WPApiConnector(lang=lang, site=site)
+        with _connectors_lock:
+            connector = _connectors.setdefault(key, connector)
+    elif getattr(settings, 'WP_API_PREFETCH_ON_STARTUP', False):
+        connector.refresh_taxonomies(float('inf'))
+    else:
+        connector.refresh_taxonomies(connector.taxonomies_cache_time)
+    return connector
+
+
+def clear_connectors(**kwargs):
+    with _connectors_lock:
+        _connectors.clear()
+
+
+setting_changed.connect(clear_connectors)
+
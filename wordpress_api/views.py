@@ -1,12 +1,24 @@
+import calendar
+import functools
+import time
 import iso8601
-from django.core.cache import cache
 from django.shortcuts import render
 from django.views.generic import View
 from django.contrib import messages
-from django.http import Http404
-from django.utils.translation import get_language
+from django.http import Http404, HttpResponse, JsonResponse
 from django.conf import settings
-from .utils import WPApiConnector
+from .bloom import is_known_slug, slug_filter_enabled
+from . import timing
+from .caching import (
+    LRUCache, cache_add, cache_get, cache_keep, cache_timeout, cached)
+from .deadline import has_budget, request_deadline
+from .metrics import get_exporter
+from .profiling import profiled
+from .related import get_related_index, local_related_enabled
+from .search import get_prefix_index, normalize_query, search_cache_key
+from .shm import TermTable
+from .sites import site_for_request, site_reverse
+from .utils import get_blog_language, get_connector
 
 # Create your views here.
 try:
@@ -14,26 +26,106 @@ try:
 except AttributeError:
     cache_time = 0
 
+try:
+    search_cache_size = settings.WP_API_SEARCH_CACHE_SIZE
+except AttributeError:
+    search_cache_size = 256
+
+search_cache = LRUCache(search_cache_size)
+
+
+def normalize_post(blog):
+    """
+    Adds the date, featured image and authors of a wordpress
+    post in the format the templates expect.
+    """
+    blog['slug'] = str(blog['slug'])
+    blog['bdate'] = iso8601.parse_date(blog['date']).date()
+    featured_media = blog.get(
+        '_embedded', {}).get('wp:featuredmedia', [])
+    authors = blog.get(
+        '_embedded', {}).get('author', [])
+    if featured_media:
+        blog['featured_image'] = featured_media[0]
+    if authors:
+        blog['authors'] = authors
+    return blog
+
+
+def normalize_related_posts(related_blogs):
+    """
+    normalize_post for the related posts, which are
+    dated by their GMT date.
+    """
+    for related_blog in related_blogs:
+        normalize_post(related_blog)
+        related_blog['bdate'] = iso8601.parse_date(
+            related_blog['date_gmt']).date()
+    return related_blogs
+
+
+def post_age(post):
+    """
+    Returns the seconds since a wordpress post was published.
+    """
+    published = iso8601.parse_date(post.get('date_gmt') or post['date'])
+    return time.time() - calendar.timegm(published.utctimetuple())
+
+
+def match_terms(terms, term_ids):
+    """
+    Returns the tags or categories whose id is in term_ids,
+    in the order of terms.
+    """
+    if isinstance(terms, TermTable):
+        return terms.with_ids(term_ids)
+    return [term for term in terms if term['id'] in term_ids]
+
+
+def find_term(terms, slug):
+    """
+    Returns the tag or category of the given slug, None if there
+    is none.
+    """
+    if isinstance(terms, TermTable):
+        return terms.by_slug(slug)
+    for term in terms:
+        if term['slug'] == slug:
+            return term
+    return None
+
 
 class ParentBlogView(View):
     """
     Class that defines a method to calculate args for the wp_api
     on the fly. Most of the code of the other views is the same.
+    Setting deadline limits the seconds the wordpress requests of
+    the view may take in total. wp_site, or the wp_site url kwarg,
+    selects a site of WP_API_SITES.
     """
+    deadline = None
+    wp_site = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(ParentBlogView, cls).as_view(**initkwargs)
+        seconds = initkwargs.get('deadline', cls.deadline)
+        if seconds is None:
+            return view
+
+        def deadline_view(request, *args, **kwargs):
+            with request_deadline(seconds):
+                return view(request, *args, **kwargs)
+        return functools.update_wrapper(deadline_view, view)
 
     def __init__(self, *args, **kwargs):
         super(ParentBlogView, self).__init__(*args, **kwargs)
-        try:  # pragma: no cover
-            allow_language = settings.WP_API_ALLOW_LANGUAGE
-            if allow_language:
-                self.blog_language = str(get_language())
-            else:
-                self.blog_language = 'en'
-        except AttributeError:
-            self.blog_language = 'en'
-        self.connector = WPApiConnector(lang=self.blog_language)
-
-    def dispatch(self, *args, **kwargs):
+        self.blog_language = get_blog_language()
+
+    def dispatch(self, request, *args, **kwargs):
+        self.site = site_for_request(
+            request, kwargs.pop('wp_site', self.wp_site))
+        self.connector = get_connector(self.blog_language, self.site)
         authors = self.connector.authors
         tags = self.connector.tags
         categories = self.connector.categories
@@ -45,7 +137,36 @@ class ParentBlogView(View):
                 'The server is not reachable this moment. \
                 Please try again later')
             raise Http404
-        return super(ParentBlogView, self).dispatch(*args, **kwargs)
+        return super(ParentBlogView, self).dispatch(request, *args, **kwargs)
+
+    @property
+    def cache_time(self):
+        if self.site.cache_timeout is not None:
+            return self.site.cache_timeout
+        return cache_time
+
+    def resource_cache_time(self, resource, age=None):
+        """
+        Returns the timeout of the cache entries of a resource, the
+        entry of WP_API_CACHE_TTLS, or of the site CACHE_TTLS, if
+        there is one. age is the age of the post of the entry.
+        """
+        return cache_timeout(
+            resource, self.cache_time, age, self.site.cache_ttls)
+
+    def list_cache_time(self, page):
+        """
+        Returns the timeout of a page of posts, the first page may
+        have its own.
+        """
+        if page == 1:
+            return cache_timeout(
+                'list_first_page', self.resource_cache_time('list'),
+                ttls=self.site.cache_ttls)
+        return self.resource_cache_time('list')
+
+    def cache_key(self, key):
+        return self.site.cache_key(key)
 
     def get_wp_api_kwargs(self, **kwargs):
         try:
@@ -70,17 +191,9 @@ class ParentBlogView(View):
             raise Http404
         if not blogs['body']:
             raise Http404
-        for blog in blogs['body']:
-            blog['slug'] = str(blog['slug'])
-            blog['bdate'] = iso8601.parse_date(blog['date']).date()
-            featured_media = blog.get(
-                '_embedded', {}).get('wp:featuredmedia', [])
-            authors = blog.get(
-                '_embedded', {}).get('author', [])
-            if featured_media:
-                blog['featured_image'] = featured_media[0]
-            if authors:
-                blog['authors'] = authors
+        with timing.phase('postprocess'):
+            for blog in blogs['body']:
+                normalize_post(blog)
         context = {
             'blogs': blogs['body'],
             'tags': tags,
@@ -94,9 +207,14 @@ class ParentBlogView(View):
         }
         return context
 
+    def render_to_response(self, context):
+        with timing.phase('render'):
+            return render(self.request, self.template_name, context)
+
+    @profiled
     def get(self, request, **kwargs):
         context = self.get_context_data(**kwargs)
-        return render(request, self.template_name, context)
+        return self.render_to_response(context)
 
 
 class BlogListView(ParentBlogView):
@@ -115,14 +233,23 @@ class BlogListView(ParentBlogView):
     def get_context_data(self, **kwargs):
         api_kwargs = self.get_wp_api_kwargs(**kwargs)
         page = api_kwargs.get('page_number', 1)
-        context = cache.get(
+        if normalize_query(api_kwargs.get('search')):
+            key = search_cache_key(
+                api_kwargs['search'], page, self.connector.namespace)
+            context = search_cache.get(key)
+            get_exporter().record_cache('blog_search', context is not None)
+            if context is None:
+                context = super(BlogListView, self).get_context_data(
+                    **kwargs)
+                search_cache.set(
+                    key, context, self.resource_cache_time('search'))
+            return context
+        key = self.cache_key(
             "blog_list_cache" + self.blog_language + "_page_" + str(page))
-        context = super(BlogListView, self).get_context_data(**kwargs) if\
-            context is None else context
-        cache.add(
-            "blog_list_cache" + self.blog_language + "_page_" + str(page),
-            context, cache_time)
-        return context
+        return cached(
+            key, 'blog_list',
+            lambda: super(BlogListView, self).get_context_data(**kwargs),
+            self.list_cache_time(page))
 
 
 class BlogView(ParentBlogView):
@@ -137,80 +264,81 @@ class BlogView(ParentBlogView):
         return wp_api
 
     def get_context_data(self, **kwargs):
-        blog = cache.get("blog_cache_detail_{}_{}".format(
+        key = self.cache_key("blog_cache_detail_{}_{}".format(
             kwargs.get('slug'), self.blog_language))
-        api_kwargs = self.get_wp_api_kwargs(**kwargs)
-        blog = self.connector.get_posts(
-            **api_kwargs) if blog is None else blog
+
+        def fetch():
+            if slug_filter_enabled() and\
+               not is_known_slug(self.connector, str(kwargs.get('slug'))):
+                raise Http404
+            blog = self.connector.get_posts(
+                **self.get_wp_api_kwargs(**kwargs))
+            if 'server_error' in blog:
+                messages.add_message(self.request, messages.ERROR,
+                                     blog['server_error'])
+                raise Http404
+            return blog
+
+        blog = cached(key, 'blog_detail', fetch, lambda blog: (
+            self.resource_cache_time('detail', post_age(
+                blog['body'][0]) if blog['body'] else None)))
         tags = self.connector.tags
         categories = self.connector.categories
-        cache.add(
-            "blog_cache_detail_{}_{}".format(
-                kwargs.get('slug'), self.blog_language),
-            blog, cache_time)
-        if 'server_error' in blog or\
-           'server_error' in tags:
+        if 'server_error' in tags:
             messages.add_message(self.request, messages.ERROR,
-                                 blog['server_error'])
+                                 tags['server_error'])
             raise Http404
 
         if not blog['body']:
             raise Http404
-        bdate = iso8601.parse_date(blog['body'][0]['date'])
-
-        blog = blog['body'][0]
-        blog_categories = []
-        blog['slug'] = str(blog['slug'])
-        blog['bdate'] = iso8601.parse_date(blog['date']).date()
-        featured_media = blog.get(
-            '_embedded', {}).get('wp:featuredmedia', [])
-        authors = blog.get(
-            '_embedded', {}).get('author', [])
-        if featured_media:
-            blog['featured_image'] = featured_media[0]
-        if authors:
-            blog['authors'] = authors
-        if 'categories' in blog:
-            for category in categories:
-                if category['id'] in blog['categories']:
-                    blog_categories.append(category)
-        blog_tags = []
-        if 'tags' in blog:
-            for tag in tags:
-                if tag['id'] in blog['tags']:
-                    blog_tags.append(tag)
-            if blog_tags:
-                related_blogs = cache.get(
-                    "blog_cache_detail_related_{}_{}".format(
-                        kwargs.get('slug'), self.blog_language))
-                tag_query = ",".join([str(tag['id']) for tag in blog_tags])
+        with timing.phase('postprocess'):
+            bdate = iso8601.parse_date(blog['body'][0]['date'])
+            blog = normalize_post(blog['body'][0])
+            blog_categories = []
+            if 'categories' in blog:
+                blog_categories = match_terms(categories, blog['categories'])
+            blog_tags = []
+            if 'tags' in blog:
+                blog_tags = match_terms(tags, blog['tags'])
+        if blog_tags:
+            related_key = self.cache_key(
+                "blog_cache_detail_related_{}_{}".format(
+                    kwargs.get('slug'), self.blog_language))
+            related_blogs, stale_related = cache_get(
+                related_key, 'blog_related', stale=True)
+            tag_query = ",".join([str(tag['id']) for tag in blog_tags])
+            local_related = None
+            if related_blogs is None and local_related_enabled():
+                local_related = get_related_index(
+                    self.connector.namespace).related(blog)
+                # The index only knows the posts this process fetched,
+                # wordpress is asked when it has too few candidates.
+                if len(local_related) >= 3:
+                    related_blogs = local_related
+            if related_blogs is None and has_budget(
+                    getattr(settings, 'WP_API_DEADLINE_RESERVE', 1)):
+                # Related posts are optional, an upstream error or a
+                # close deadline only leaves them out of the page.
                 related_blogs = self.connector.get_posts(
                     wp_filter={'tag': tag_query},
                     page_number=1,
-                    orderby='date')['body'] if related_blogs is None else\
-                    related_blogs
-                for related_blog in related_blogs:
-                    related_blog['slug'] = str(related_blog['slug'])
-                    related_blog['bdate'] = iso8601.parse_date(
-                        related_blog['date']).date()
-                    featured_media = related_blog.get(
-                        '_embedded', {}).get('wp:featuredmedia', [])
-                    authors = related_blog.get(
-                        '_embedded', {}).get('author', [])
-                    if featured_media:
-                        related_blog['featured_image'] = featured_media[0]
-                    if authors:
-                        related_blog['authors'] = authors
-                cache.add(
-                    "blog_cache_detail_related_{}_{}".format(
-                        kwargs.get('slug'), self.blog_language),
-                    related_blogs, cache_time)
-
-                for related in related_blogs:
-                    related_bdate = iso8601.parse_date(related['date_gmt'])
-                    related['bdate'] = related_bdate.date()
-            else:
-                related_blogs = []
+                    orderby='date').get('body')
+            if related_blogs is None and stale_related is not None:
+                # Refreshing them early failed, the cached ones are
+                # still valid.
+                cache_keep(related_key)
+                related_blogs = stale_related
+            if related_blogs is not None:
+                with timing.phase('postprocess'):
+                    normalize_related_posts(related_blogs)
+                if related_blogs is not local_related and\
+                   related_blogs is not stale_related:
+                    # Local results differ per process, they are not
+                    # shared through the cache.
+                    cache_add(
+                        related_key, related_blogs,
+                        self.resource_cache_time('related', post_age(blog)))
+            related_blogs = related_blogs or []
         else:
             related_blogs = []
         if blog in related_blogs:
@@ -235,34 +363,28 @@ class CategoryBlogListView(ParentBlogView):
 
     def get_wp_api_kwargs(self, **kwargs):
         slug = kwargs.get('slug')
-        self.category = None
-        for category in self.connector.categories:
-            if category['slug'] == slug:
-                self.category = category
-                break
+        self.category = find_term(self.connector.categories, slug)
         if self.category is None:
             raise Http404
         wp_api = super(CategoryBlogListView, self).get_wp_api_kwargs(**kwargs)
         wp_api['wp_filter'] = {'categories': self.category['id']}
         return wp_api
 
+    @profiled
     def get(self, request, **kwargs):
         api_kwargs = self.get_wp_api_kwargs(**kwargs)
         page = api_kwargs.get('page_number', 1)
-        context = cache.get(
+        key = self.cache_key(
             "blog_category_context_" +
             kwargs.get('slug') + self.blog_language + '_page_' + str(page))
-        context = self.get_context_data(**kwargs) if\
-            context is None else context
-        cache.add(
-            "blog_category_context_" +
-            kwargs.get('slug') + self.blog_language + '_page_' + str(page),
-            context, cache_time)
+        context = cached(
+            key, 'blog_category', lambda: self.get_context_data(**kwargs),
+            self.list_cache_time(page))
         category_name = None
         context['category'] = self.category
         category_name = self.category['name']
         context['category_name'] = category_name
-        return render(request, self.template_name, context)
+        return self.render_to_response(context)
 
 
 class TagBlogListView(ParentBlogView):
@@ -273,32 +395,27 @@ class TagBlogListView(ParentBlogView):
 
     def get_wp_api_kwargs(self, **kwargs):
         slug = kwargs.get('slug')
-        self.tag = None
-        for tag in self.connector.tags:
-            if tag['slug'] == slug:
-                self.tag = tag
-                break
+        self.tag = find_term(self.connector.tags, slug)
         if self.tag is None:
             raise Http404
         wp_api = super(TagBlogListView, self).get_wp_api_kwargs(**kwargs)
         wp_api['wp_filter'] = {'tags': self.tag['id']}
         return wp_api
 
+    @profiled
     def get(self, request, **kwargs):
         api_kwargs = self.get_wp_api_kwargs(**kwargs)
         page = api_kwargs.get('page_number', 1)
-        context = cache.get("blog_tag_context_" + kwargs.get('slug') +
-                            self.blog_language + '_page_' + str(page))
-        context = self.get_context_data(**kwargs) if\
-            context is None else context
-        cache.add("blog_tag_context_" + kwargs.get('slug') +
-                  self.blog_language + '_page_' + str(page),
-                  context, cache_time)
+        key = self.cache_key("blog_tag_context_" + kwargs.get('slug') +
+                             self.blog_language + '_page_' + str(page))
+        context = cached(
+            key, 'blog_tag', lambda: self.get_context_data(**kwargs),
+            self.list_cache_time(page))
         category_name = None
         context['tag'] = self.tag
         category_name = self.tag['name']
         context['tag_name'] = category_name
-        return render(request, self.template_name, context)
+        return self.render_to_response(context)
 
 
 class BlogByAuthorListView(ParentBlogView):
@@ -317,16 +434,15 @@ class BlogByAuthorListView(ParentBlogView):
             raise Http404
         return wp_api
 
+    @profiled
     def get(self, request, **kwargs):
         api_kwargs = self.get_wp_api_kwargs(**kwargs)
         page = api_kwargs.get('page_number', 1)
-        context = cache.get("blog_author_context_" + kwargs.get('slug') +
-                            self.blog_language + '_page_' + str(page))
-        context = self.get_context_data(**kwargs) if\
-            context is None else context
-        cache.add("blog_author_context_" + kwargs.get('slug') +
-                  self.blog_language + '_page_' + str(page),
-                  context, cache_time)
+        key = self.cache_key("blog_author_context_" + kwargs.get('slug') +
+                             self.blog_language + '_page_' + str(page))
+        context = cached(
+            key, 'blog_author', lambda: self.get_context_data(**kwargs),
+            self.list_cache_time(page))
         author_name = None
         if context['blogs']:
             for blog in context['blogs']:
@@ -336,5 +452,46 @@ class BlogByAuthorListView(ParentBlogView):
                     if str(author['slug']) == kwargs.get('slug'):
                         author_name = kwargs.get('slug')
                         context['author_name'] = author_name
-                        return render(
-                            request, self.template_name, context)
+                        return self.render_to_response(context)
+
+
+class AutocompleteView(View):
+    """
+    JSON typeahead for the blog search. Suggestions come from
+    the in-memory prefix index, wordpress is never queried.
+    """
+    wp_site = None
+    url_names = {
+        'post': 'wordpress_api_blog_detail',
+        'tag': 'wordpress_api_blog_tag_list',
+        'category': 'wordpress_api_blog_category_list',
+    }
+
+    def get(self, request, **kwargs):
+        query = request.GET.get('q', '')
+        try:
+            limit = min(int(request.GET.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        site = site_for_request(request, kwargs.get('wp_site', self.wp_site))
+        suggestions = get_prefix_index(
+            site.namespace(get_blog_language())).suggest(query, limit)
+        for suggestion in suggestions:
+            suggestion['url'] = site_reverse(
+                request, self.url_names[suggestion['type']],
+                args=[suggestion['slug']])
+        return JsonResponse({'query': query, 'suggestions': suggestions})
+
+
+class MetricsView(View):
+    """
+    Exposes the connector and cache metrics in the prometheus
+    text format. Needs an exporter with a render method.
+    """
+
+    def get(self, request, **kwargs):
+        exporter = get_exporter()
+        if not hasattr(exporter, 'render'):
+            raise Http404
+        return HttpResponse(
+            exporter.render(), content_type='text/plain; version=0.0.4')